@@ -2,9 +2,13 @@
 #
 # (c) 2019 Yoichi Tanibayashi
 #
+import os
 import time
-import copy
+import hashlib
+import inspect
 import threading
+import collections
+import numpy as np
 import RPi.GPIO as rpigpio
 from luma.core.interface.serial import i2c, spi
 # from luma.core.render import canvas
@@ -14,12 +18,90 @@ from luma.oled.device import ssd1306, ssd1327, ssd1331
 import Adafruit_GPIO.SPI as SPI
 # from ST7789 import ST7789 as st7789
 # from st7789 import st7789
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageChops
 from MyLogger import get_logger
 import click
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
+class RetryPolicy:
+    """
+    display() retry policy
+
+    max_retry:    retries before the frame is dropped
+    wait_sec:     first backoff, multiplied by `factor` on every retry
+    max_wait_sec: backoff limit
+    reopen_after: consecutive errors before reopening the interface
+    """
+    def __init__(self, max_retry=5, wait_sec=0.1, factor=2.0,
+                 max_wait_sec=2.0, reopen_after=3):
+        self.max_retry    = max_retry
+        self.wait_sec     = wait_sec
+        self.factor       = factor
+        self.max_wait_sec = max_wait_sec
+        self.reopen_after = max(reopen_after, 1)
+
+    def wait(self, n):
+        """
+        backoff before the (n + 1)th retry
+        """
+        return min(self.wait_sec * self.factor ** n, self.max_wait_sec)
+
+
+class DirtyDraw:
+    """
+    ImageDraw wrapper: report the bounding box of every drawing call
+    to `mark_dirty(box)`
+    """
+    SHAPES = ['arc', 'chord', 'ellipse', 'line', 'pieslice', 'point',
+              'polygon', 'rectangle', 'rounded_rectangle']
+
+    def __init__(self, image, mark_dirty):
+        self._draw = ImageDraw.Draw(image)
+        self._mark_dirty = mark_dirty
+
+    def __getattr__(self, name):
+        func = getattr(self._draw, name)
+        if name not in self.SHAPES:
+            return func
+
+        def shape(xy, *args, **kwargs):
+            self._mark_dirty(self.xy_box(xy, kwargs.get('width', 1)))
+            return func(xy, *args, **kwargs)
+
+        return shape
+
+    @staticmethod
+    def xy_box(xy, width=1):
+        """
+        [(x1, y1), (x2, y2), ..] or [x1, y1, x2, y2, ..] -> (x0, y0, x1, y1)
+        """
+        if isinstance(xy[0], (tuple, list)):
+            xs = [p[0] for p in xy]
+            ys = [p[1] for p in xy]
+        else:
+            xs = xy[0::2]
+            ys = xy[1::2]
+        w = int(width or 1) // 2 + 1
+        return (int(min(xs)) - w, int(min(ys)) - w,
+                int(max(xs)) + w, int(max(ys)) + w)
+
+    def text(self, xy, text, fill=None, font=None, *args, **kwargs):
+        if hasattr(self._draw, 'textbbox'):
+            (x0, y0, x1, y1) = self._draw.textbbox(xy, text, font=font)
+        else:
+            (w, h) = self._draw.textsize(text, font=font)
+            (x0, y0, x1, y1) = (xy[0], xy[1], xy[0] + w, xy[1] + h)
+        self._mark_dirty((int(x0), int(y0), int(x1), int(y1)))
+        return self._draw.text(xy, text, fill, font, *args, **kwargs)
+
+    def bitmap(self, xy, bitmap, fill=None):
+        self._mark_dirty((int(xy[0]), int(xy[1]),
+                          int(xy[0]) + bitmap.size[0] - 1,
+                          int(xy[1]) + bitmap.size[1] - 1))
+        return self._draw.bitmap(xy, bitmap, fill)
+
+
 class Oled:
     """
 OLED
@@ -44,18 +126,66 @@ SPI pins
     SPI_RST = 25
     SPI_CS  = 8
 
-    def __init__(self, dev, param1=-1, param2=-1, debug=False):
+    DIRTY_MAX = 4  # max number of dirty boxes kept before merging
+
+    MAX_SRC_PIXELS = 16 * 1000 * 1000  # see fit_image()
+    REDUCE_CONVERT = {'1': 'L', 'I;16': 'I'}   # others: 'RGBA'
+
+    # 180 degrees by the controller: SEGREMAP, COM scan direction
+    HW_ROTATE2 = {'ssd1306': [0xA0, 0xC0],
+                  'ssd1331': [0xA0, 0x60]}
+
+    def __init__(self, dev, param1=-1, param2=-1, async_flush=False,
+                 retry=None, image_cache=None, rotate=0, debug=False):
+        """
+        rotate:      x 90 degrees clockwise. 180 degrees is done by
+                     the controller (HW_ROTATE2), others by luma
+        retry:       RetryPolicy, None: RetryPolicy()
+        image_cache: ImageCache for loadImagefile(), None: ImageCache()
+                     False: no cache
+        """
         self._dbg = debug
         self._log = get_logger(__class__.__name__, self._dbg)
         self._log.debug('dev    = %s',   dev)
         self._log.debug('param1 = %d',   param1)
         self._log.debug('param2 = %d(0x%X)', param2, param2)
+        self._log.debug('async_flush = %s', async_flush)
+        self._log.debug('rotate = %d',   rotate)
 
         self.dev  = dev
         self.param1 = param1
         self.param2 = param2
+        self.rotate = rotate
 
         self.enable = False
+        self.flusher = None
+
+        self.retry = retry
+        if self.retry is None:
+            self.retry = RetryPolicy()
+
+        self.max_src_pixels = self.MAX_SRC_PIXELS
+
+        self.image_cache = image_cache
+        if self.image_cache is None:
+            self.image_cache = ImageCache(debug=self._dbg)
+        elif self.image_cache is False:
+            self.image_cache = None
+
+        self.bus_errors = 0     # OSError, DeviceNotFoundError
+        self.err_seq = 0        # consecutive errors
+        self.err_time = None    # time of the first error in sequence
+        self.reopens = 0
+        self.recoveries = 0
+        self.recovery_sec = 0.0
+        self.failed = 0         # frames given up after retries
+        self.resync = False     # panel content unknown: push everything
+        self.shown = None       # copy of the frame on the panel
+        self.skipped = 0        # display() calls with an identical frame
+
+        # reopen() in the flush thread vs. the device calls
+        self.disp_lock = threading.RLock()
+        self.serial = None
 
         if param1 < 0:
             if dev in self.I2C_DEV:
@@ -78,6 +208,10 @@ SPI pins
         if self.open() == self:
             self.enable = True
 
+        if async_flush:
+            self.flusher = OledFlusher(self, debug=self._dbg)
+            self.flusher.start()
+
     def __enter__(self):
         self._log.debug('enter \'with\' block')
 
@@ -92,61 +226,127 @@ SPI pins
     def open(self):
         self._log.debug('')
 
+        self.open_disp()
+
+        if self.disp_size is not None:
+            self.image = Image.new(self.mode, self.disp_size)
+        else:
+            self.image = Image.new(self.mode, self.disp.size)
+        self.draw  = DirtyDraw(self.image, self.mark_dirty)
+
+        # the pigpio drivers take an address window: display(img, x0, ..)
+        self.partial = 'x0' in inspect.signature(self.disp.display).parameters
+        self._log.debug('partial = %s', self.partial)
+
+        self.dirty = []
+        self.layer = None       # StaticLayer under the drawings
+        self.overlay = []       # boxes drawn on top of self.layer
+        self.mark_dirty()
+
+        # self.clear()
+
+        return self
+
+    def open_disp(self):
+        """
+        open the serial interface and the device.
+        self.serial, self.disp and self.mode are replaced only when
+        the new device is ready: on failure the old ones are kept
+        """
+        self._log.debug('')
+
         rpigpio.setwarnings(False)
 
-        self.disp = None
-        self.disp_size = None
-        self.mode = ''
+        serial = None
+        disp = None
+        disp_size = None
+        mode = ''
+
+        # luma rotates every frame in software: only when the
+        # controller cannot
+        hw_rotate = self.rotate == 2 and self.dev in self.HW_ROTATE2
+        sw_rotate = 0 if hw_rotate else self.rotate
+
         if self.dev == 'ssd1306':
             if self.param2 == 0:
                 self.param2 = self.I2C_ADDR
-            self.serial = i2c(port=self.param1, address=self.param2)
-            self.disp   = ssd1306(self.serial)
-            self.mode   = '1'
+            serial = i2c(port=self.param1, address=self.param2)
+            disp   = ssd1306(serial, rotate=sw_rotate)
+            mode   = '1'
 
         if self.dev == 'ssd1327':
             if self.param2 == 0:
                 self.param2 = self.I2C_ADDR
-            self.serial = i2c(port=self.param1, address=self.param2)
-            self.disp   = ssd1327(self.serial)
-            self.mode   = 'RGB'
+            serial = i2c(port=self.param1, address=self.param2)
+            disp   = ssd1327(serial, rotate=sw_rotate)
+            mode   = 'RGB'
+            if sw_rotate == 0:
+                # grey canvas, packed by SSD1327Gray
+                mode = 'L'
 
         if self.dev == 'ssd1331':
-            self.serial = spi(device=self.param1, port=self.param2)
-            self.disp   = ssd1331(self.serial)
-            self.mode   = 'RGB'
+            serial = spi(device=self.param1, port=self.param2)
+            disp   = ssd1331(serial, rotate=sw_rotate)
+            mode   = 'RGB'
 
         if self.dev == 'st7789':
             """
-            self.serial = spi(device=self.param1, port=self.param2,
-                              cs_high=False)
-            self.disp   = st7789(self.serial)
-            self.mode   = 'RGB'
+            serial = spi(device=self.param1, port=self.param2,
+                         cs_high=False)
+            disp   = st7789(serial)
+            mode   = 'RGB'
             """
             self.SPI_MODE = 0b11
-            self.serial = SPI.SpiDev(self.param1, self.param2)
-            self.disp   = st7789(spi=self.serial, mode=self.SPI_MODE,
-                                 rst=self.SPI_RST, dc=self.SPI_DC,
-                                 led=self.SPI_CS)
-            self.disp_size = (self.disp.width, self.disp.height)
-            self.mode   = 'RGB'
-            self.disp.begin()
-
-        if self.mode == '':
+            serial = SPI.SpiDev(self.param1, self.param2)
+            disp   = st7789(spi=serial, mode=self.SPI_MODE,
+                            rst=self.SPI_RST, dc=self.SPI_DC,
+                            led=self.SPI_CS)
+            disp_size = (disp.width, disp.height)
+            mode   = 'RGB'
+            disp.begin()
+
+        if mode == '':
             self._log.error('invalid device: %s', self.dev)
             raise RuntimeError('invalid device: %s' % self.dev)
 
-        self.disp.persist = True
+        if hw_rotate:
+            disp.command(*self.HW_ROTATE2[self.dev])
 
-        if self.disp_size is not None:
-            self.image = Image.new(self.mode, self.disp_size)
-        else:
-            self.image = Image.new(self.mode, self.disp.size)
-        self.draw  = ImageDraw.Draw(self.image)
+        disp.persist = True
 
-        # self.clear()
+        if self.dev == 'ssd1327' and mode == 'L':
+            disp = SSD1327Gray(disp, debug=self._dbg)
 
-        return self
+        with self.disp_lock:
+            self.serial = serial
+            self.disp = disp
+            self.disp_size = disp_size
+            self.mode = mode
+
+    def reopen(self):
+        """
+        reopen the serial interface after bus errors.
+        The old device stays in self.disp if it fails: the next try
+        of _send() uses it and counts as a bus error again
+        """
+        self._log.warning('reopen %s', self.dev)
+        self.reopens += 1
+
+        with self.disp_lock:
+            try:
+                self.serial.cleanup()
+            except Exception as e:
+                self._log.debug('%s:%s', type(e).__name__, e)
+
+            try:
+                self.open_disp()
+            except Exception as e:
+                self._log.error('%s:%s', type(e).__name__, e)
+                return False
+
+            # the panel content is unknown
+            self.resync = True
+        return True
 
     def available(self):
         if self.enable:
@@ -161,6 +361,10 @@ SPI pins
             self._log.debug('OLED is not available')
             return
 
+        if self.flusher is not None:
+            self.flusher.end()
+            self.flusher = None
+
         try:
             self.disp.cleanup()
         except AttributeError:
@@ -177,37 +381,299 @@ SPI pins
         if display_now:
             self.display()
 
+    def mark_dirty(self, box=None):
+        """
+        box: (x0, y0, x1, y1) .. inclusive, None: whole display
+        """
+        (w, h) = self.image.size
+        if box is None:
+            box = (0, 0, w - 1, h - 1)
+
+        (x0, y0, x1, y1) = box
+        box = (max(x0, 0), max(y0, 0), min(x1, w - 1), min(y1, h - 1))
+        if box[0] > box[2] or box[1] > box[3]:
+            return
+
+        self.dirty = merge_box(self.dirty, box, self.DIRTY_MAX)
+        if self.layer is not None:
+            self.overlay = merge_box(self.overlay, box, self.DIRTY_MAX)
+
+    def show_layer(self, layer):
+        """
+        put `layer` (StaticLayer) under the canvas: self.image is
+        replaced with it and the next display() pushes the whole frame,
+        from the native bytes of the layer if the driver takes them.
+
+        layer: None .. forget the layer
+        """
+        self.layer = layer
+        self.overlay = []
+        if layer is None:
+            return
+
+        self.image.paste(layer.image, (0, 0))
+        (w, h) = self.image.size
+        self.dirty = [(0, 0, w - 1, h - 1)]
+
+    def restore_layer(self):
+        """
+        erase what was drawn since the last call by copying the
+        static layer back into those boxes only
+        """
+        if self.layer is None:
+            return
+
+        for box in self.overlay:
+            (x0, y0, x1, y1) = box
+            region = (x0, y0, x1 + 1, y1 + 1)
+            self.image.paste(self.layer.image.crop(region), region)
+            self.dirty = merge_box(self.dirty, box, self.DIRTY_MAX)
+        self.overlay = []
+
+    def layer_data(self, boxes):
+        """
+        native bytes of the static layer if the frame is pushed as a
+        whole, else None.
+        With drawings on the layer (overlay), only if the driver takes
+        windows: they are sent after it, see _flush()
+        """
+        if self.layer is None or self.layer.data is None:
+            return None
+        if len(self.overlay) > 0 and not self.partial:
+            return None
+
+        (w, h) = self.image.size
+        if boxes != [(0, 0, w - 1, h - 1)]:
+            return None
+        return self.layer.data
+
     def display(self, img=None):
+        """
+        img: None .. push only the dirty boxes of self.image
+
+        with `async_flush`, the frame is handed to the flush thread
+        and this returns at once
+
+        Only the parts of the dirty boxes that differ from the frame on
+        the panel are sent. Nothing is sent if no pixel differs (counted
+        as `skipped`).
+
+        Returns False if the frame was dropped after the retries of
+        the retry policy.
+        """
         self._log.debug('')
 
+        if self.resync:
+            self.resync = False
+            self.shown = None
+            self.mark_dirty()
+
+        boxes = self.dirty
+        self.dirty = []
         if img is None:
             img = self.image
+        else:
+            # the panel will not show self.image any more
+            boxes = []
+            self.mark_dirty()
+
+        # not with the fallback below: it may not be the bare layer
+        data = None
+        if img is self.image and self.flusher is None:
+            data = self.layer_data(boxes)
+
+        if len(boxes) == 0:
+            # drawn without mark_dirty()
+            boxes = [(0, 0, img.width - 1, img.height - 1)]
+
+        # the panel shows these pixels already: no bus transfer
+        changed = self.changed_boxes(img, boxes)
+        if len(changed) == 0:
+            self.skipped += 1
+            return True
+        if data is None:
+            boxes = changed
+        else:
+            # drawn on the layer
+            boxes = list(self.overlay)
+
+        # what the panel receives
+        sent = boxes
+        if data is not None or not self.partial:
+            sent = [(0, 0, img.width - 1, img.height - 1)]
+
+        if self.flusher is not None:
+            # a failure in the flush thread sets `resync`
+            self.flusher.submit(img, boxes)
+            self.remember_shown(img, sent)
+            return True
 
-        while True:
-            try:
-                self.disp.display(img)
-                break
-            except (OSError, error.DeviceNotFoundError) as e:
-                self._log.error('%s:%s', type(e), e)
-                time.sleep(0.1)
+        if not self._flush(img, boxes, data):
+            return False
+
+        self.remember_shown(img, sent)
+        return True
+
+    def changed_boxes(self, img, boxes):
+        """
+        the parts of `boxes` where `img` differs from the frame on the
+        panel. Only the pixels in the boxes are compared.
+        """
+        if self.shown is None or self.shown.mode != img.mode:
+            return boxes
+
+        changed = []
+        for (x0, y0, x1, y1) in boxes:
+            region = (x0, y0, x1 + 1, y1 + 1)
+            bbox = ImageChops.difference(img.crop(region),
+                                         self.shown.crop(region)).getbbox()
+            if bbox is not None:
+                changed.append((x0 + bbox[0], y0 + bbox[1],
+                                x0 + bbox[2] - 1, y0 + bbox[3] - 1))
+        return changed
+
+    def remember_shown(self, img, boxes):
+        """
+        the panel shows the pixels of `boxes` of `img` now
+        """
+        if self.shown is None or self.shown.mode != img.mode:
+            self.shown = img.copy()
+            return
+
+        for (x0, y0, x1, y1) in boxes:
+            region = (x0, y0, x1 + 1, y1 + 1)
+            self.shown.paste(img.crop(region), region)
+
+    def _flush(self, img, boxes, data=None):
+        """
+        data: native bytes of the static layer, see layer_data().
+              `boxes` of img are sent on top of it
+        """
+        if data is not None:
+            calls = [('display_data', data)]
+            calls += [('display', img) + tuple(box) for box in boxes]
+        elif not self.partial:
+            calls = [('display', img)]
+        else:
+            calls = [('display', img) + tuple(box) for box in boxes]
+        self._log.debug('boxes = %s, native = %s', boxes, data is not None)
+
+        for args in calls:
+            if not self._send(*args):
+                self.failed += 1
+                self._log.warning('frame dropped: %d', self.failed)
+                self.resync = True
+                return False
+
+        return True
+
+    def _send(self, name, *args):
+        """
+        call self.disp.<name>(*args) with the retry policy.
+        The method is looked up on every try: reopen() replaces self.disp.
+        disp_lock keeps reopen() in the flush thread from swapping the
+        device in the middle of a call
+        """
+        for n in range(self.retry.max_retry + 1):
+            if n > 0:
+                time.sleep(self.retry.wait(n - 1))
+
+            with self.disp_lock:
+                try:
+                    getattr(self.disp, name)(*args)
+                except (OSError, error.DeviceNotFoundError) as e:
+                    self._log.error('%s:%s', type(e), e)
+                    self.bus_errors += 1
+                    self.err_seq += 1
+                    if self.err_time is None:
+                        self.err_time = time.monotonic()
+                    if self.err_seq % self.retry.reopen_after == 0:
+                        self.reopen()
+                    continue
+
+            if self.err_time is not None:
+                sec = time.monotonic() - self.err_time
+                self._log.info('recovered: %.2f sec', sec)
+                self.recoveries += 1
+                self.recovery_sec += sec
+                self.err_time = None
+            self.err_seq = 0
+            return True
+
+        return False
+
+    def stats(self):
+        """
+        counters for tuning the refresh rate
+        """
+        st = {'bus_errors': self.bus_errors,
+              'reopens': self.reopens,
+              'recoveries': self.recoveries,
+              'recovery_sec': self.recovery_sec,
+              'failed': self.failed,
+              'skipped': self.skipped}
+        if self.flusher is not None:
+            st['submitted'] = self.flusher.submitted
+            st['dropped'] = self.flusher.dropped
+            st['flushed'] = self.flusher.flushed
+        if self.image_cache is not None:
+            st['image_cache'] = self.image_cache.stats()
+        return st
+
+    def scroll(self, top, rows, dy):
+        """
+        scroll the band of pixel rows [top, top + rows) of self.image
+        up by dy and blank the bottom dy rows.
+
+        When the controller can shift the band itself (hardware scroll),
+        only the blank rows are marked dirty. The luma devices have no
+        scroll(): only a driver with the pigpio scroll() interface does.
+        Returns True when done in hardware.
+        """
+        (w, h) = self.image.size
+        band = self.image.crop((0, top + dy, w, top + rows))
+        self.image.paste(band, (0, top))
+        self.image.paste(0, (0, top + rows - dy, w, top + rows))
+
+        hw = False
+        if self.flusher is None and hasattr(self.disp, 'scroll'):
+            hw = self.disp.scroll(top, rows, dy)
+        self._log.debug('hw = %s', hw)
+
+        if not hw:
+            self.mark_dirty((0, top, w - 1, top + rows - 1))
+            return False
+
+        # the rows that wrapped around on the panel are not known
+        self.shown = None
+
+        # pending damage moved with the pixels
+        (boxes, self.dirty) = (self.dirty, [])
+        for (x0, y0, x1, y1) in boxes:
+            self.mark_dirty((x0, y0, x1, y1))
+            if y1 >= top and y0 < top + rows:
+                self.mark_dirty((x0, max(y0 - dy, top), x1, y1 - dy))
+        self.mark_dirty((0, top + rows - dy, w - 1, top + rows - 1))
+        return True
 
     def loadImagefile(self, imgfile, display_now=False, clear_flag=False):
         self._log.debug('imgfile = %s', imgfile)
 
-        im = Image.open(imgfile)
+        size = (self.disp.width, self.disp.height)
+        resample = Image.BICUBIC
 
-        w = im.width
-        h = im.height
-        if w > self.disp.width or h > self.disp.height:
-            a1 = w / self.disp.width
-            a2 = h / self.disp.height
+        key = None
+        im2 = None
+        if self.image_cache is not None:
+            key = self.image_cache.key(imgfile, size, self.mode, resample)
+            im2 = self.image_cache.get(key)
 
-            if a1 > a2:
-                w = self.disp.width
-                h = int(h / a1)
-            else:
-                w = int(w / a2)
-                h = self.disp.height
+        if im2 is None:
+            im2 = self.fit_image(imgfile, size, resample)
+            if key is not None:
+                self.image_cache.put(key, im2)
+
+        (w, h) = im2.size
         self._log.debug('(w, h) = (%d, %d)', w, h)
 
         x = int((self.disp.width - w) / 2)
@@ -217,12 +683,688 @@ SPI pins
         if clear_flag:
             self.clear(display_now=False)
 
-        im2 = im.resize((w, h), Image.BICUBIC)
-
         self.image.paste(im2, (x, y))
+        self.mark_dirty((x, y, x + w - 1, y + h - 1))
         if display_now:
             self.display()
 
+    def fit_image(self, imgfile, size, resample=Image.BICUBIC):
+        """
+        decode `imgfile` and shrink it to fit in `size`
+        Returns an image in the canvas mode
+
+        JPEG is decoded at a reduced scale (draft mode) and large images
+        are shrunk by an integer factor (reduce) before resampling.
+        Sources larger than `max_src_pixels` after that are refused
+        before they are decoded.
+        """
+        im = Image.open(imgfile)
+
+        w = im.width
+        h = im.height
+        if w > size[0] or h > size[1]:
+            a1 = w / size[0]
+            a2 = h / size[1]
+
+            if a1 > a2:
+                w = size[0]
+                h = int(h / a1)
+            else:
+                w = int(w / a2)
+                h = size[1]
+
+            # extreme aspect ratios: keep a line of at least 1 pixel
+            w = max(w, 1)
+            h = max(h, 1)
+
+        if im.format == 'JPEG':
+            # decode at 1/2, 1/4 or 1/8 scale, not smaller than (w, h)
+            im.draft(im.mode, (w, h))
+            self._log.debug('draft: %s', im.size)
+
+        if im.width * im.height > self.max_src_pixels:
+            self._log.error('%s: too large: %dx%d', imgfile,
+                            im.width, im.height)
+            raise RuntimeError('%s: too large: %dx%d' % (
+                imgfile, im.width, im.height))
+
+        factor = min(im.width // w, im.height // h)
+        if factor >= 2:
+            if im.mode in ('1', 'P', 'PA') or im.mode.startswith('I;16'):
+                # reduce() does not take these modes (nor would averaged
+                # palette indices make sense)
+                im = im.convert(self.REDUCE_CONVERT.get(im.mode[:4], 'RGBA'))
+                self._log.debug('convert: %s', im.mode)
+            im = im.reduce(factor)
+            self._log.debug('reduce(%d): %s', factor, im.size)
+
+        im2 = im.resize((w, h), resample)
+        if im2.mode != self.mode:
+            im2 = im2.convert(self.mode)
+        return im2
+
+
+class SSD1327Gray:
+    """
+    grey pipeline for the luma ssd1327 device
+
+    luma converts every RGB pixel to 4 bits in a Python loop. Here the
+    'L' canvas goes through a gamma LUT and is packed two pixels per
+    byte with numpy, into buffers kept across frames, and written with
+    disp.command()/disp.data() for the pixel window only.
+
+    Other attributes are those of the luma device.
+    """
+    GAMMA = 1.0
+
+    def __init__(self, disp, gamma=GAMMA, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('gamma = %s', gamma)
+
+        self.disp = disp
+
+        # 8 bit grey -> 4 bit level
+        v = np.arange(256) / 255
+        self.lut = np.round(v ** gamma * 15).astype(np.uint8)
+
+        (w, h) = self.disp.size
+        self.grey = np.empty(w * h, dtype=np.uint8)
+        self.buf = np.empty(w * h // 2, dtype=np.uint8)
+
+    def __getattr__(self, name):
+        return getattr(self.disp, name)
+
+    def pack(self, pix):
+        """
+        pix: uint8 array (rows, even columns)
+        Returns the packed bytes as a view of self.buf
+        """
+        (h, w) = pix.shape
+        grey = self.grey[:h * w].reshape(h, w)
+        np.take(self.lut, pix, out=grey)
+
+        out = self.buf[:h * w // 2].reshape(h, w // 2)
+        # luma nibble_order=1: the odd pixel in the high nibble
+        np.left_shift(grey[:, 1::2], 4, out=out)
+        out |= grey[:, 0::2]
+        return self.buf[:h * w // 2]
+
+    def display(self, image, x0=0, y0=0, x1=None, y1=None):
+        """
+        (x0, y0), (x1, y1): pixel, columns are widened to byte pairs
+        """
+        if x1 is None:
+            x1 = self.disp.width - 1
+        if y1 is None:
+            y1 = self.disp.height - 1
+        (x0, x1) = (x0 & ~1, x1 | 1)
+
+        if image.mode != 'L':
+            image = image.convert('L')
+        pix = np.asarray(image)[y0:y1 + 1, x0:x1 + 1]
+
+        data = self.pack(pix)
+        self.disp.command(0x15, x0 >> 1, x1 >> 1, 0x75, y0, y1)
+        self.disp.data(memoryview(data))
+
+    def image_to_data(self, image):
+        """
+        the whole frame packed as display() sends it
+        """
+        if image.mode != 'L':
+            image = image.convert('L')
+        return bytes(self.pack(np.asarray(image)))
+
+    def display_data(self, data):
+        """
+        data: bytes of image_to_data()
+        """
+        (w, h) = self.disp.size
+        self.disp.command(0x15, 0, (w - 1) >> 1, 0x75, 0, h - 1)
+        self.disp.data(memoryview(data))
+
+
+class ImageCache:
+    """
+    cache of decoded and fitted images
+
+    key:    (path, mtime, display size, color mode, resample filter)
+    memory: LRU within `max_bytes`
+    disk:   raw pixels in the color mode under `cache_dir`
+            (None: memory only)
+
+    The pixels are kept in the canvas mode, not in the bytes of the
+    driver (image_to_data()): loadImagefile() pastes them into the
+    canvas, where they are drawn over and compared with the panel.
+    Whole frames in native bytes are kept by StaticLayer.
+    """
+    CACHE_DIR = os.path.expanduser('~/.cache/OledServer')
+    MAX_BYTES = 4 * 1024 * 1024
+    MAGIC     = b'OLIMG1'
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('cache_dir = %s', cache_dir)
+        self._log.debug('max_bytes = %d', max_bytes)
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self.mem = collections.OrderedDict()
+        self.mem_bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, path, size, mode, resample):
+        mtime = os.stat(path).st_mtime_ns
+        return (os.path.abspath(path), mtime, tuple(size), mode, int(resample))
+
+    def _file(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.raw')
+
+    def get(self, key):
+        with self.lock:
+            im = self.mem.get(key)
+            if im is not None:
+                self.mem.move_to_end(key)
+                self.hits += 1
+                return im
+
+        im = self._load(key)
+        if im is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        self._remember(key, im)
+        return im
+
+    def put(self, key, im):
+        self._remember(key, im)
+        self._save(key, im)
+
+    def _remember(self, key, im):
+        nbytes = self._nbytes(im)
+        if nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.mem:
+                return
+            self.mem[key] = im
+            self.mem_bytes += nbytes
+            while self.mem_bytes > self.max_bytes:
+                (k, old) = self.mem.popitem(last=False)
+                self.mem_bytes -= self._nbytes(old)
+
+    @staticmethod
+    def _nbytes(im):
+        return im.width * im.height * len(im.getbands())
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+
+        try:
+            with open(self._file(key), 'rb') as f:
+                hdr = f.readline().split()
+                data = f.read()
+            if hdr[0] != self.MAGIC:
+                return None
+            (mode, w, h) = (hdr[1].decode(), int(hdr[2]), int(hdr[3]))
+            return Image.frombytes(mode, (w, h), data)
+        except (OSError, ValueError, IndexError) as e:
+            self._log.debug('%s:%s', type(e).__name__, e)
+            return None
+
+    def _save(self, key, im):
+        if self.cache_dir is None:
+            return
+
+        path = self._file(key)
+        tmp = '%s.%d' % (path, os.getpid())
+        hdr = b'%s %s %d %d\n' % (self.MAGIC, im.mode.encode(),
+                                   im.width, im.height)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(hdr)
+                f.write(im.tobytes())
+            os.replace(tmp, path)
+        except OSError as e:
+            self._log.warning('%s:%s', type(e).__name__, e)
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'entries': len(self.mem),
+                'bytes': self.mem_bytes}
+
+
+class StaticLayer:
+    """
+    a still frame kept ready for the panel, see Oled.show_layer()
+
+    image: copy in the canvas mode, restores what was drawn on top
+    data:  the whole frame in device-native bytes,
+           None if the driver has no display_data()
+    """
+    def __init__(self, ol, image, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+
+        self.image = image.copy()
+        if self.image.mode != ol.image.mode:
+            self.image = self.image.convert(ol.image.mode)
+
+        self.data = None
+        if hasattr(ol.disp, 'display_data'):
+            self.data = bytes(ol.disp.image_to_data(self.image))
+            self._log.debug('data: %d bytes', len(self.data))
+
+
+class Sprite:
+    """
+    an image put on the canvas by Scene.compose()
+
+    image: the pixels, in the canvas mode
+    mask:  '1' or 'L' image of the same size, None: opaque
+    """
+    def __init__(self, image, xy=(0, 0), mask=None):
+        self.image = image
+        self.mask  = mask
+        (self.x, self.y) = xy
+        self.visible = True
+
+        self.prev    = None     # box when last composed
+        self.changed = True     # new pixels, see set_image()
+
+    def move_to(self, x, y):
+        (self.x, self.y) = (int(x), int(y))
+
+    def show(self, visible=True):
+        self.visible = visible
+
+    def set_image(self, image, mask=None):
+        self.image   = image
+        self.mask    = mask
+        self.changed = True
+
+    def box(self):
+        """
+        (x0, y0, x1, y1) .. inclusive, None: not shown
+        """
+        if not self.visible:
+            return None
+        return (self.x, self.y,
+                self.x + self.image.width - 1, self.y + self.image.height - 1)
+
+
+class TextLayer(Sprite):
+    """
+    a text rendered once and kept until set_text() changes it.
+    Only the glyph pixels cover the layers below.
+    """
+    def __init__(self, mode, font, xy=(0, 0), fill=255, text=''):
+        self.mode = mode
+        self.font = font
+        self.fill = fill
+        self.text = None
+        super().__init__(Image.new(mode, (1, 1)), xy, Image.new('L', (1, 1)))
+
+        self.set_text(text)
+
+    def set_text(self, text):
+        if text == self.text:
+            return
+        self.text = text
+
+        try:
+            (w, h) = self.font.getbbox(text)[2:]
+        except AttributeError:
+            # Pillow < 8.0
+            (w, h) = self.font.getsize(text)
+        size = (max(w, 1), max(h, 1))
+
+        mask = Image.new('L', size)
+        ImageDraw.Draw(mask).text((0, 0), text, fill=255, font=self.font)
+        self.set_image(Image.new(self.mode, size, self.fill), mask)
+
+
+class Scene:
+    """
+    layers of the Oled canvas, bottom first:
+
+      static .. Oled.layer (StaticLayer, see Oled.show_layer()),
+                black if None
+      others .. Sprite or TextLayer, in the order of add()
+
+    compose() re-renders only the boxes where a layer moved or changed
+    (previous and current box) from the cached layer images and marks
+    them dirty, so that Oled.display() pushes those windows only.
+    """
+    def __init__(self, ol, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+
+        self.ol     = ol
+        self.layers = []
+        self.static = None
+        self.damage = []        # boxes to re-render at the next compose()
+
+        self.frames = 0
+        self.boxes  = 0
+        self.pixels = 0
+
+    def add(self, layer):
+        layer.prev    = None
+        layer.changed = True
+        self.layers.append(layer)
+        return layer
+
+    def remove(self, layer):
+        self.layers.remove(layer)
+        if layer.prev is not None:
+            self.damage = merge_box(self.damage, layer.prev,
+                                    self.ol.DIRTY_MAX)
+
+    def compose(self):
+        """
+        Returns the re-rendered boxes
+        """
+        size = self.ol.image.size
+        damage = self.damage
+        self.damage = []
+
+        if self.ol.layer is not self.static:
+            # show_layer() painted the canvas over: put all layers again
+            self.static = self.ol.layer
+            for layer in self.layers:
+                layer.prev = None
+
+        for layer in self.layers:
+            box = layer.box()
+            if box == layer.prev and not layer.changed:
+                continue
+
+            for b in (layer.prev, box):
+                if b is None:
+                    continue
+                b = box_clip(b, size)
+                if b is not None:
+                    damage = merge_box(damage, b, self.ol.DIRTY_MAX)
+            layer.prev    = box
+            layer.changed = False
+
+        for box in damage:
+            self.render(box)
+        self._log.debug('damage = %s', damage)
+
+        if self.static is not None:
+            # the canvas is the static layer with the layers on top:
+            # it differs from the layer only in their boxes, none when
+            # no layer is shown (see Oled.layer_data())
+            overlay = []
+            for layer in self.layers:
+                b = None
+                if layer.prev is not None:
+                    b = box_clip(layer.prev, size)
+                if b is not None:
+                    overlay = merge_box(overlay, b, self.ol.DIRTY_MAX)
+            self.ol.overlay = overlay
+
+        self.frames += 1
+        self.boxes  += len(damage)
+        self.pixels += sum([box_area(b) for b in damage])
+        return damage
+
+    def render(self, box):
+        """
+        paint the layers in `box` and mark it dirty
+        """
+        (x0, y0, x1, y1) = box
+        region = (x0, y0, x1 + 1, y1 + 1)
+
+        if self.static is not None:
+            img = self.static.image.crop(region)
+        else:
+            img = Image.new(self.ol.image.mode, (x1 - x0 + 1, y1 - y0 + 1))
+
+        for layer in self.layers:
+            b = layer.box()
+            if b is None or not box_overlap(b, box):
+                continue
+            img.paste(layer.image, (b[0] - x0, b[1] - y0), layer.mask)
+
+        self.ol.image.paste(img, region)
+        self.ol.mark_dirty(box)
+
+    def stats(self):
+        return {'frames': self.frames, 'boxes': self.boxes,
+                'pixels': self.pixels}
+
+
+class OledFlusher(threading.Thread):
+    """
+    flush thread that owns the device
+
+    Frames are copied into the back buffer of a double buffer.
+    If frames arrive while a transfer is running, only the newest one
+    is sent and the dirty boxes of the dropped ones are carried over.
+    """
+    def __init__(self, ol, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+
+        self.ol = ol
+
+        self.front = Image.new(self.ol.image.mode, self.ol.image.size)
+        self.back  = Image.new(self.ol.image.mode, self.ol.image.size)
+        self.boxes = []		# dirty boxes of self.back
+        self.pending = False
+
+        self.submitted = 0
+        self.dropped = 0
+        self.flushed = 0
+
+        self.running = True
+        self.cond = threading.Condition()
+
+        super().__init__(daemon=True)
+
+    def submit(self, img, boxes):
+        with self.cond:
+            self.submitted += 1
+            if self.pending:
+                self.dropped += 1
+                self._log.debug('drop: %d', self.dropped)
+
+            self.back.paste(img)
+            for box in boxes:
+                self.boxes = merge_box(self.boxes, box, self.ol.DIRTY_MAX)
+            self.pending = True
+            self.cond.notify()
+
+    def end(self):
+        self._log.debug('')
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.join()
+        self._log.debug('done')
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.pending:
+                    break
+
+                (self.front, self.back) = (self.back, self.front)
+                boxes = self.boxes
+                self.boxes = []
+                self.pending = False
+
+            self.ol._flush(self.front, boxes)
+            self.flushed += 1
+
+
+class FrameScheduler:
+    """
+    deadline paced frame loop on top of Oled
+
+    update(): fixed time step, called `update_fps` times per second
+    render(): draw the frame, followed by ol.display()
+
+    A frame that runs late skips the frame slots it missed instead of
+    trying to catch up; updates keep their own schedule.
+    """
+    MAX_CATCHUP = 5  # max updates run back to back before resync
+
+    def __init__(self, ol, fps=30, update=None, render=None,
+                 update_fps=None, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('fps        = %s', fps)
+        self._log.debug('update_fps = %s', update_fps)
+
+        self.ol = ol
+        self.update = update
+        self.render = render
+
+        self.period = 1.0 / fps
+        self.update_period = self.period
+        if update_fps is not None:
+            self.update_period = 1.0 / update_fps
+
+        self.frames = 0
+        self.skipped = 0
+        self.updates = 0
+        self.busy_sec = 0.0
+
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        st = {'frames': self.frames, 'skipped': self.skipped,
+              'updates': self.updates}
+        if self.frames > 0:
+            st['busy'] = self.busy_sec / (self.frames * self.period)
+        return st
+
+    def run(self):
+        self.running = True
+
+        t_frame = t_update = time.monotonic()
+        while self.running:
+            t_start = time.monotonic()
+
+            if self.update is not None:
+                n = 0
+                while t_update <= t_start and n < self.MAX_CATCHUP:
+                    self.update()
+                    self.updates += 1
+                    t_update += self.update_period
+                    n += 1
+                if t_update <= t_start:
+                    self._log.debug('update resync')
+                    t_update = t_start + self.update_period
+
+            if self.render is not None:
+                self.render()
+            self.ol.display()
+            self.frames += 1
+
+            now = time.monotonic()
+            self.busy_sec += now - t_start
+
+            t_frame += self.period
+            if now - t_frame >= self.period:
+                missed = int((now - t_frame) / self.period)
+                self._log.debug('late: skip %d frames', missed)
+                self.skipped += missed
+                t_frame += missed * self.period
+
+            if t_frame > now:
+                time.sleep(t_frame - now)
+
+
+def box_area(box):
+    (x0, y0, x1, y1) = box
+    return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+
+def box_union(b1, b2):
+    return (min(b1[0], b2[0]), min(b1[1], b2[1]),
+            max(b1[2], b2[2]), max(b1[3], b2[3]))
+
+
+def box_touch(b1, b2):
+    """
+    overlapping or adjacent
+    """
+    return (b1[0] <= b2[2] + 1 and b2[0] <= b1[2] + 1 and
+            b1[1] <= b2[3] + 1 and b2[1] <= b1[3] + 1)
+
+
+def box_overlap(b1, b2):
+    return (b1[0] <= b2[2] and b2[0] <= b1[2] and
+            b1[1] <= b2[3] and b2[1] <= b1[3])
+
+
+def box_clip(box, size):
+    """
+    clip `box` to an image of `size`, None: outside
+    """
+    (w, h) = size
+    box = (max(box[0], 0), max(box[1], 0),
+           min(box[2], w - 1), min(box[3], h - 1))
+    if box[0] > box[2] or box[1] > box[3]:
+        return None
+    return box
+
+
+def merge_box(boxes, box, max_boxes):
+    """
+    add `box` to `boxes` and return a new list of at most `max_boxes`
+    bounding boxes
+    """
+    rest = []
+    for b in boxes:
+        if box_touch(b, box):
+            box = box_union(b, box)
+        else:
+            rest.append(b)
+
+    if len(rest) < len(boxes):
+        # the grown box may touch others now
+        return merge_box(rest, box, max_boxes)
+
+    rest.append(box)
+
+    while len(rest) > max_boxes:
+        # merge the pair that wastes the fewest pixels
+        best = None
+        for i in range(len(rest)):
+            for j in range(i + 1, len(rest)):
+                u = box_union(rest[i], rest[j])
+                waste = box_area(u) - box_area(rest[i]) - box_area(rest[j])
+                if best is None or waste < best[0]:
+                    best = (waste, i, j, u)
+        (waste, i, j, u) = best
+        rest = [b for k, b in enumerate(rest) if k not in (i, j)]
+        rest = merge_box(rest, u, max_boxes)
+
+    return rest
+
 
 class BG:
     IMGFILE = ['rpilogo-2052x2581.png',
@@ -249,22 +1391,37 @@ class BG:
         for img in self.IMGFILE:
             self.ol.draw.rectangle(xy, outline=self.color, fill='black')
             self.ol.loadImagefile(img)
-            # self.bg_img.append(self.ol.image)
-            self.bg_img.append(copy.copy(self.ol.image))
+            for i in range(3):
+                xy = [(self.x1 + i, self.y1 + i), (self.x2 - i, self.y2 - i)]
+                self.ol.draw.rectangle(xy, outline=self.color, fill=None)
+            self.bg_img.append(StaticLayer(self.ol, self.ol.image,
+                                           debug=self._dbg))
 
         self.prev_sec = 0
         self.bg_idx = 0
 
-    def draw(self):
+    def switch(self):
+        """
+        show the next background every INTERVAL_SEC
+
+        Returns True when switched
+        """
         now_sec = time.time()
-        if now_sec - self.prev_sec > self.INTERVAL_SEC:
-            self.bg_idx = (self.bg_idx + 1) % len(self.IMGFILE)
-            self.prev_sec = now_sec
-        self.ol.image.paste(self.bg_img[self.bg_idx], (0, 0))
+        if now_sec - self.prev_sec <= self.INTERVAL_SEC:
+            return False
 
-        for i in range(3):
-            xy = [(self.x1 + i, self.y1 + i), (self.x2 - i, self.y2 - i)]
-            self.ol.draw.rectangle(xy, outline=self.color, fill=None)
+        self.bg_idx = (self.bg_idx + 1) % len(self.IMGFILE)
+        self.prev_sec = now_sec
+        self.ol.show_layer(self.bg_img[self.bg_idx])
+        return True
+
+    def draw(self):
+        """
+        switch the background, otherwise erase only what was drawn on
+        it since the last call
+        """
+        if not self.switch():
+            self.ol.restore_layer()
 
 
 class Ball:
@@ -282,6 +1439,9 @@ class Ball:
         self.r = r
         (self.vx, self.vy) = vxy
 
+        self.sprite = Sprite(Image.new(self.ol.image.mode, (r + 1, r + 1),
+                                       color))
+
         self.lock = threading.Lock()
 
     def move(self):
@@ -307,29 +1467,31 @@ class Ball:
         self.lock.release()
 
     def draw(self):
+        """
+        place the sprite: Scene.compose() puts it on the canvas
+        """
         self.lock.acquire()
         self._log.debug('')
 
         x1 = round(self.x - self.r / 2)
         y1 = round(self.y - self.r / 2)
-        x2 = x1 + self.r
-        y2 = y1 + self.r
-
-        self.ol.draw.rectangle([(x1, y1), (x2, y2)],
-                               outline=self.color, fill=self.color)
+        self.sprite.move_to(x1, y1)
 
         self.lock.release()
 
 
 class Sample:
-    def __init__(self, dev, debug=False):
+    def __init__(self, dev, fps=30, async_flush=False, debug=False):
         self._dbg = debug
         self._log = get_logger(__class__.__name__, debug)
         self._log.debug('dev  = %s',   dev)
+        self._log.debug('fps  = %s',   fps)
 
         self.dev  = dev
+        self.fps  = fps
+        self.fs   = None
 
-        self.ol = Oled(self.dev, debug=self._dbg)
+        self.ol = Oled(self.dev, async_flush=async_flush, debug=self._dbg)
 
         self.col = {}
         self.col['bg'] = 255
@@ -338,6 +1500,7 @@ class Sample:
             self.col['bg'] = 0x00ff00  # 'green'
             self.col['ball'] = ['red', 'blue']
 
+        self.scene = Scene(self.ol, debug=self._dbg)
         self.bg   = BG(self.ol, self.col['bg'], 2, debug=self._dbg)
         self.ball = []
         self.ball.append(Ball(self.ol, self.col['ball'][0],
@@ -346,48 +1509,52 @@ class Sample:
         self.ball.append(Ball(self.ol, self.col['ball'][1],
                               7, (10, 5), (1, -2),
                               debug=self._dbg))
+        for b in self.ball:
+            self.scene.add(b.sprite)
 
-        self.bg.draw()
-        for i in range(len(self.ball)):
-            self.ball[i].draw()
+        self.draw()
         self.ol.display()
 
     def move(self):
-        while True:
-            for i in range(len(self.ball)):
-                self.ball[i].move()
-            time.sleep(0.03)
+        for i in range(len(self.ball)):
+            self.ball[i].move()
 
     def draw(self):
-        self.bg.draw()
+        self.bg.switch()
         for i in range(len(self.ball)):
             self.ball[i].draw()
+        self.scene.compose()
 
     def main(self):
-        disp_th = threading.Thread(target=self.move, daemon=True)
-        disp_th.start()
-
-        while True:
-            self.draw()
-            self.ol.display()
-            time.sleep(0.01)
+        self.fs = FrameScheduler(self.ol, self.fps, update=self.move,
+                                 render=self.draw, update_fps=1 / 0.03,
+                                 debug=self._dbg)
+        self.fs.run()
 
     def finish(self):
         self._log.debug('')
+        self._log.info('stats: %s', self.ol.stats())
+        if self.fs is not None:
+            self._log.info('frame: %s', self.fs.stats())
+        self._log.info('scene: %s', self.scene.stats())
         self.ol.cleanup()
 
 
 @click.command(context_settings=CONTEXT_SETTINGS)
 @click.argument('dev', type=str, metavar='<ssd1306|ssd1327|ssd1331|st7789>',
                 nargs=1)
+@click.option('--fps', '-f', 'fps', type=float, default=30,
+              help='frames per second')
+@click.option('--async', '-a', 'async_flush', is_flag=True, default=False,
+              help='flush in background thread')
 @click.option('--debug', '-d', 'debug', is_flag=True, default=False,
               help='debug flag')
-def main(dev, debug):
+def main(dev, fps, async_flush, debug):
     log = get_logger(__name__, debug)
     log.debug('dev   = %s', dev)
     log.debug('debug = %s', debug)
 
-    obj = Sample(dev, debug=debug)
+    obj = Sample(dev, fps=fps, async_flush=async_flush, debug=debug)
     try:
         obj.main()
     finally:
@@ -4,6 +4,7 @@
 #
 import telnetlib
 import sys
+import json
 import time
 import click
 from ipaddr import ipaddr
@@ -36,6 +37,7 @@ class OledClient:
 
     CMD_PREFIX = '@@@'
     ACK = 'ACK\r\n'.encode('utf-8')
+    STATS = 'STATS '.encode('utf-8')
 
     def __init__(self, host=DEF_HOST, port=DEF_PORT, debug=False):
         self.debug = debug
@@ -123,6 +125,27 @@ class OledClient:
     def crlf(self, flag=True):
         return self.send('%s crlf %s' % (__class__.CMD_PREFIX, flag))
 
+    def stats(self):
+        """
+        cache and display statistics of the server
+        Returns {'text': .., 'oled': ..}, None on error
+        """
+        try:
+            self.tn.write(('%s stats\r\n' % __class__.CMD_PREFIX).encode(
+                'utf-8'))
+            ret = self.tn.read_until(__class__.ACK, 2)
+        except Exception as e:
+            self.logger.error('%s:%s', type(e), e)
+            return None
+        self.logger.debug('%s', ret)
+
+        for line in ret.split(b'\r\n'):
+            if line.startswith(__class__.STATS):
+                return json.loads(line[len(__class__.STATS):])
+
+        self.logger.error('no statistics: %s', ret)
+        return None
+
 #####
 def clock_mode(host, port, myip, mode=1, sec=2):
     prev_str_time = ''
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+OledMirror.py
+
+Mirror a Linux framebuffer (/dev/fbN) or a plain file onto the panel.
+
+The source is mmap'ed read only. Every 1/fps sec the panel sized area
+at `xy` is copied once, compared with the last copy in TILE x TILE
+pixel tiles, and only the changed tiles are converted and marked dirty.
+
+Pixel formats of the source:
+
+  rgb565 .. 16 bit little endian (fbdev 16bpp)
+  rgb888 .. 3 bytes: R, G, B
+  1      .. 1 bit, MSB first (PIL '1' raw)
+
+Usage:
+
+--
+ol = Oled('ssd1331')
+mirror = OledMirror(ol, '/dev/fb0')
+mirror.main()
+--
+"""
+__author__ = 'Yoichi Tanibayashi'
+__date__   = '2020'
+
+import os
+import mmap
+import time
+import numpy as np
+from PIL import Image
+from Oled import Oled
+from MyLogger import get_logger
+import click
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+
+class OledMirror:
+    FORMATS = {'rgb565': 16, 'rgb888': 24, '1': 1}   # bits per pixel
+    TILE = 16
+    DEF_FPS = 10
+
+    def __init__(self, ol, path, fmt=None, size=None, stride=None, offset=0,
+                 xy=(0, 0), fps=DEF_FPS, debug=False):
+        """
+        ol:     Oled
+        path:   /dev/fbN or a file
+        fmt:    'rgb565', 'rgb888', '1', None: from /sys/class/graphics
+        size:   (w, h) of the source, None: from /sys/class/graphics
+        stride: bytes per row, None: w * bits per pixel / 8
+        offset: byte offset of the first row
+        xy:     origin of the mirrored area in the source
+        """
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('path   = %s', path)
+        self._log.debug('fmt    = %s', fmt)
+        self._log.debug('size   = %s', size)
+        self._log.debug('xy     = %s', xy)
+        self._log.debug('fps    = %s', fps)
+
+        self.ol   = ol
+        self.path = path
+        self.xy   = xy
+        self.fps  = fps
+
+        if fmt is None or size is None:
+            (fmt0, size0, stride0) = self.fb_geometry(path)
+            fmt = fmt or fmt0
+            size = size or size0
+            stride = stride or stride0
+        if fmt not in self.FORMATS:
+            self._log.error('invalid format: %s', fmt)
+            raise RuntimeError('invalid format: %s' % fmt)
+        self.fmt  = fmt
+        self.size = size
+
+        bpp = self.FORMATS[fmt]
+        if stride is None:
+            stride = (size[0] * bpp + 7) // 8
+        self.stride = stride
+
+        # the mirrored area: panel sized, clipped to the source
+        (x, y) = xy
+        self.w = min(self.ol.image.width, size[0] - x)
+        self.h = min(self.ol.image.height, size[1] - y)
+        if self.w <= 0 or self.h <= 0:
+            self._log.error('xy out of source: %s', xy)
+            raise RuntimeError('xy out of source: %s' % (xy,))
+        if fmt == '1' and x % 8 != 0:
+            self._log.error('x must be a multiple of 8: %d', x)
+            raise RuntimeError('x must be a multiple of 8: %d' % x)
+
+        # bytes of the area in each row
+        self.b0 = x * bpp // 8
+        self.b1 = (x * bpp + self.w * bpp + 7) // 8
+
+        # a device has no file size: map the length explicitly
+        nbytes = offset + stride * size[1]
+        with open(path, 'rb') as f:
+            try:
+                self.mm = mmap.mmap(f.fileno(), nbytes,
+                                    access=mmap.ACCESS_READ)
+            except ValueError as e:
+                self._log.error('%s: %s: %d bytes', path, e, nbytes)
+                raise RuntimeError('%s: too short' % path)
+
+        # zero copy view: src[row, byte]
+        self.src = np.frombuffer(self.mm, dtype=np.uint8,
+                                 count=stride * size[1], offset=offset
+                                 ).reshape(size[1], stride)
+
+        self.prev = None
+
+        self.samples = 0
+        self.idle    = 0
+        self.tiles   = 0
+
+    @classmethod
+    def fb_geometry(cls, path):
+        """
+        (fmt, size, stride) of /dev/fbN from sysfs
+        """
+        name = os.path.basename(path)
+        sysfs = '/sys/class/graphics/%s/' % name
+
+        def read(attr):
+            with open(sysfs + attr) as f:
+                return f.read().strip()
+
+        try:
+            (w, h) = [int(v) for v in read('virtual_size').split(',')]
+            bpp = int(read('bits_per_pixel'))
+            stride = int(read('stride'))
+        except OSError:
+            raise RuntimeError('%s: give format and size' % path)
+
+        for (fmt, bits) in cls.FORMATS.items():
+            if bits == bpp:
+                return (fmt, (w, h), stride)
+        raise RuntimeError('%s: %d bpp not supported' % (path, bpp))
+
+    def close(self):
+        self._log.debug('')
+        self.src = None
+        self.mm.close()
+
+    def changed_tiles(self, cur):
+        """
+        [(tile row, [tile column, ..]), ..] where `cur` differs from
+        the last sample
+        """
+        if self.prev is None:
+            diff = np.ones(cur.shape, dtype=bool)
+        else:
+            diff = cur != self.prev
+
+        # bytes per tile in a row
+        tb = max(self.TILE * self.FORMATS[self.fmt] // 8, 1)
+        ty = -(-diff.shape[0] // self.TILE)
+        tx = -(-diff.shape[1] // tb)
+        pad = np.zeros((ty * self.TILE, tx * tb), dtype=bool)
+        pad[:diff.shape[0], :diff.shape[1]] = diff
+        tiles = pad.reshape(ty, self.TILE, tx, tb).any(axis=(1, 3))
+
+        return [(r, np.flatnonzero(tiles[r]))
+                for r in np.flatnonzero(tiles.any(axis=1))]
+
+    def to_image(self, cur, x0, y0, x1, y1):
+        """
+        pixels [x0, x1) x [y0, y1) of the area as an image of the
+        canvas mode
+        """
+        (w, h) = (x1 - x0, y1 - y0)
+        if self.fmt == 'rgb565':
+            v = np.ascontiguousarray(cur[y0:y1, x0 * 2:x1 * 2]).view('<u2')
+            rgb = np.empty((h, w, 3), dtype=np.uint8)
+            rgb[:, :, 0] = (v >> 8) & 0xF8
+            rgb[:, :, 1] = (v >> 3) & 0xFC
+            rgb[:, :, 2] = (v << 3) & 0xF8
+            img = Image.fromarray(rgb, 'RGB')
+        elif self.fmt == 'rgb888':
+            rgb = cur[y0:y1, x0 * 3:x1 * 3].reshape(h, w, 3)
+            img = Image.fromarray(np.ascontiguousarray(rgb), 'RGB')
+        else:
+            # x0 is on a byte boundary: tiles are multiples of 8 pixels
+            data = np.ascontiguousarray(cur[y0:y1, x0 // 8:(x1 + 7) // 8])
+            img = Image.frombytes('1', (data.shape[1] * 8, h),
+                                  data.tobytes()).crop((0, 0, w, h))
+
+        if img.mode != self.ol.image.mode:
+            img = img.convert(self.ol.image.mode)
+        return img
+
+    def sample(self):
+        """
+        copy the changed tiles into the canvas and mark them dirty
+
+        Returns the number of changed tiles
+        """
+        (x, y) = self.xy
+        # one copy: the source may change while it is compared
+        cur = self.src[y:y + self.h, self.b0:self.b1].copy()
+        rows = self.changed_tiles(cur)
+        self.prev = cur
+
+        self.samples += 1
+        n = 0
+        for (r, cols) in rows:
+            y0 = int(r) * self.TILE
+            y1 = min(y0 + self.TILE, self.h)
+
+            # runs of adjacent tiles: one conversion each
+            brk = np.flatnonzero(np.diff(cols) > 1)
+            for (ca, cb) in zip(cols[np.r_[0, brk + 1]],
+                                cols[np.r_[brk, len(cols) - 1]]):
+                x0 = int(ca) * self.TILE
+                x1 = min((int(cb) + 1) * self.TILE, self.w)
+                self.ol.image.paste(self.to_image(cur, x0, y0, x1, y1),
+                                    (x0, y0))
+                self.ol.mark_dirty((x0, y0, x1 - 1, y1 - 1))
+            n += len(cols)
+
+        if n == 0:
+            self.idle += 1
+        self.tiles += n
+        return n
+
+    def main(self):
+        interval = 1 / self.fps
+        next_sec = time.monotonic()
+        while True:
+            if self.sample() > 0:
+                self.ol.display()
+
+            next_sec += interval
+            sleep_sec = next_sec - time.monotonic()
+            if sleep_sec > 0:
+                time.sleep(sleep_sec)
+            else:
+                # too slow: do not try to catch up
+                next_sec = time.monotonic()
+
+    def stats(self):
+        return {'samples': self.samples, 'idle': self.idle,
+                'tiles': self.tiles}
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('dev', type=str, metavar='<ssd1306|ssd1327|ssd1331|st7789>',
+                nargs=1)
+@click.argument('path', type=click.Path(exists=True), nargs=1)
+@click.option('--format', '-F', 'fmt', type=click.Choice(['rgb565', 'rgb888',
+                                                           '1']),
+              default=None, help='pixel format of the source')
+@click.option('--size', '-s', 'size', type=(int, int), default=(None, None),
+              help='width height of the source')
+@click.option('--stride', 'stride', type=int, default=None,
+              help='bytes per row of the source')
+@click.option('--offset', 'offset', type=int, default=0,
+              help='byte offset of the first row')
+@click.option('--xy', 'xy', type=(int, int), default=(0, 0),
+              help='origin of the mirrored area')
+@click.option('--fps', '-f', 'fps', type=float, default=OledMirror.DEF_FPS,
+              help='samples per second')
+@click.option('--debug', '-d', 'debug', is_flag=True, default=False,
+              help='debug flag')
+def main(dev, path, fmt, size, stride, offset, xy, fps, debug):
+    log = get_logger(__name__, debug)
+    log.debug('dev  = %s', dev)
+    log.debug('path = %s', path)
+
+    if size == (None, None):
+        size = None
+
+    ol = Oled(dev, debug=debug)
+    obj = OledMirror(ol, path, fmt, size, stride, offset, xy, fps,
+                     debug=debug)
+    try:
+        obj.main()
+    finally:
+        print('finally')
+        log.info('stats: %s', obj.stats())
+        obj.close()
+        ol.cleanup()
+
+
+if __name__ == '__main__':
+    main()
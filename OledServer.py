@@ -6,9 +6,11 @@ import sys
 import time
 import threading
 import queue
+import json
 import socketserver
 import click
 from OledText import OledText
+from OledShm import FrameBuffer, FrameBufferWatcher
 from ipaddr import ipaddr
 
 from logging import getLogger, StreamHandler, Formatter, DEBUG, INFO, WARN
@@ -41,17 +43,23 @@ def init_logger(name, debug):
 class OledWorker(threading.Thread):
     CMD_PREFIX = '@@@'
     
-    def __init__(self, device='ssd1306', header=0, footer=0, debug=False):
+    def __init__(self, device='ssd1306', header=0, footer=0,
+                 async_flush=False, shm=None, rotate=0, debug=False):
         self.logger = init_logger(__class__.__name__, debug)
         self.logger.debug('device = %s', device)
         self.logger.debug('header = %d', header)
         self.logger.debug('footer = %d', footer)
+        self.logger.debug('async_flush = %s', async_flush)
+        self.logger.debug('shm    = %s', shm)
+        self.logger.debug('rotate = %d', rotate)
 
         self.device = device
         
         self.msgq = queue.Queue()
+        self.held = None        # taken from msgq but not handled yet
 
         self.ot = OledText(self.device, headerlines=header, footerlines=footer,
+                           async_flush=async_flush, rotate=rotate,
                            debug=debug)
         if not self.ot.enable:
             self.logger.error('OledText is not available')
@@ -59,6 +67,16 @@ class OledWorker(threading.Thread):
         
         self.zenkakuflag = False
         self.logger.debug('self.zenkakuflag = %s', self.zenkakuflag)
+
+        # framebuffer for other processes, see OledShm.py
+        self.fb = None
+        self.fbw = None
+        if shm is not None:
+            img = self.ot.oled.image
+            self.fb = FrameBuffer(shm, img.size, img.mode, create=True,
+                                  debug=debug)
+            self.fbw = FrameBufferWatcher(self.fb, self.notify_fb,
+                                          debug=debug)
         super().__init__()
 
     def set_zenkaku(self, flag):
@@ -74,13 +92,51 @@ class OledWorker(threading.Thread):
     def send_cmd(self, msg_text):
         self.send('cmd', msg_text)
 
+    def stats(self):
+        """
+        cache and display statistics, see '@@@ stats'
+        """
+        return {'text': self.ot.stats(), 'oled': self.ot.oled.stats()}
+
+    def notify_fb(self):
+        self.send_cmd('shm')
+
     def recv(self):
-        msg = self.msgq.get()
+        if self.held is not None:
+            (msg, self.held) = (self.held, None)
+        else:
+            msg = self.msgq.get()
         self.logger.debug('msg = %s', msg)
         return msg['type'], msg['content']
         
+    def hold(self, msg_type, msg_content):
+        """
+        give the message back: recv() returns it next
+        """
+        self.held = {'type': msg_type, 'content': msg_content}
+
     def msg_empty(self):
-        return self.msgq.empty()
+        return self.held is None and self.msgq.empty()
+
+    def is_text(self, msg_type, msg_content):
+        if msg_type == 'cmd':
+            return False
+        return msg_content.split()[:1] != [__class__.CMD_PREFIX]
+
+    def expand(self, msg_content):
+        """
+        server side variable
+        """
+        msg_content = msg_content.replace('@DATE@',
+                                          time.strftime('%Y/%m/%d(%a)'))
+        msg_content = msg_content.replace('@TIME@',
+                                          time.strftime('%H:%M:%S'))
+        msg_content = msg_content.replace('@IFNAME@', ipaddr().if_name())
+        msg_content = msg_content.replace('@IPADDR@', ipaddr().ip_addr())
+        for ch in 'YmdaHMS':
+            msg_content = msg_content.replace('@' + ch + '@',
+                                              time.strftime('%' + ch))
+        return msg_content
 
     def end(self):
         self.logger.debug('')
@@ -88,11 +144,19 @@ class OledWorker(threading.Thread):
         self.logger.debug('send cmd \'end\'')
         self.join()
         self.logger.debug('join(): done')
+        if self.fb is not None:
+            self.fbw.end()
+            self.fb.close()
 
     def run(self):
+        if self.fbw is not None:
+            self.fbw.start()
+
         while True:
             if self.msg_empty():
-                self.ot._display(True)
+                if not self.ot._display(True):
+                    self.logger.warning('display failed: %s',
+                                        self.ot.oled.stats())
                 self.logger.debug('wait msg ..')
 
             msg_type, msg_content = self.recv()
@@ -101,6 +165,11 @@ class OledWorker(threading.Thread):
                 self.logger.debug('recv (%s:%s)', msg_type, msg_content)
                 break
 
+            if msg_type == 'cmd' and msg_content == 'shm':
+                # pushed by the next _display()
+                self.fb.update(self.ot.oled)
+                continue
+
             #
             # main work
             #
@@ -121,6 +190,13 @@ class OledWorker(threading.Thread):
                             if args[0] == 'False':
                                 self.ot.set_crlf(False)
                         continue
+                    if cmd == 'scroll':
+                        # software scroll here: see main() help
+                        self.ot.set_scroll(True)
+                        if len(args) > 0:
+                            if args[0] == 'False':
+                                self.ot.set_scroll(False)
+                        continue
                     if cmd == 'row':
                         if len(args) > 0:
                             self.ot.set_row(int(args[0]))
@@ -137,19 +213,27 @@ class OledWorker(threading.Thread):
                     if cmd == 'clear':
                         self.ot.clear(display_now=False)
                         continue
+                    if cmd == 'stats':
+                        # sent to the client by OledHandler
+                        st = self.stats()
+                        self.logger.info('text: %s', st['text'])
+                        self.logger.info('oled: %s', st['oled'])
+                        continue
                 
-            # server side variable
-            msg_content = msg_content.replace('@DATE@',
-                                              time.strftime('%Y/%m/%d(%a)'))
-            msg_content = msg_content.replace('@TIME@',
-                                              time.strftime('%H:%M:%S'))
-            msg_content = msg_content.replace('@IFNAME@', ipaddr().if_name())
-            msg_content = msg_content.replace('@IPADDR@', ipaddr().ip_addr())
-            for ch in 'YmdaHMS':
-                msg_content = msg_content.replace('@' + ch + '@',
-                                                  time.strftime('%' + ch))
-
-            self.ot.print(msg_content, display_now=False)
+            # text messages queued after this one: drawn at once
+            lines = [self.expand(msg_content)]
+            while not self.msg_empty():
+                msg_type, msg_content = self.recv()
+                if not self.is_text(msg_type, msg_content):
+                    self.hold(msg_type, msg_content)
+                    break
+                lines.append(self.expand(msg_content))
+
+            if len(lines) == 1:
+                self.ot.print(lines[0], display_now=False)
+            else:
+                self.logger.debug('%d lines', len(lines))
+                self.ot.print_lines(lines, display_now=False)
 
             time.sleep(0.01)
             
@@ -165,6 +249,7 @@ class OledWorker(threading.Thread):
 #
 class OledHandler(socketserver.StreamRequestHandler):
     ACK = 'ACK\r\n'.encode('utf-8')
+    STATS = 'STATS'
 
     def setup(self):
         self.logger = init_logger(__class__.__name__, self.server.debug)
@@ -179,6 +264,13 @@ class OledHandler(socketserver.StreamRequestHandler):
     def send_ack(self):
         self.write(__class__.ACK)
 
+    def send_stats(self):
+        """
+        one line before the ACK: 'STATS {"text": .., "oled": ..}'
+        """
+        st = json.dumps(self.server.worker.stats())
+        self.write(('%s %s\r\n' % (__class__.STATS, st)).encode('utf-8'))
+
     def getline(self, byte_data):
         TELNET_TO_BYTE = {
             b'\xff\xed\xff\xfd\x06': b'\x9a',
@@ -259,6 +351,10 @@ class OledHandler(socketserver.StreamRequestHandler):
             # send message to worker
             self.server.worker.send_msg(line)
 
+            if line.split() == [OledWorker.CMD_PREFIX, 'stats']:
+                # counters as of now: lines still queued are not in yet
+                self.send_stats()
+
             # replay ack
             self.send_ack()
             self.logger.debug('replay ACK')
@@ -277,7 +373,8 @@ class OledServer(socketserver.TCPServer):
     allow_reuse_address = True
 
     def __init__(self, device='ssd1306', header=0, footer=0, port=DEF_PORT,
-                 handler=OledHandler, worker=OledWorker, debug=False):
+                 handler=OledHandler, worker=OledWorker, async_flush=False,
+                 shm=None, rotate=0, debug=False):
         self.logger = init_logger(__class__.__name__, debug)
         self.logger.debug('device = %s', device)
         self.logger.debug('hader  = %d', header)
@@ -287,7 +384,9 @@ class OledServer(socketserver.TCPServer):
         self.device     = device
         self.debug      = debug
         
-        self.worker	= worker(self.device, header, footer, debug=debug)
+        self.worker	= worker(self.device, header, footer,
+                                 async_flush=async_flush, shm=shm,
+                                 rotate=rotate, debug=debug)
         self.logger.debug('self.worker = %s', self.worker)
         self.worker.start()
         
@@ -307,7 +406,15 @@ class OledServer(socketserver.TCPServer):
 
 #####
 #CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
-@click.command(help='OLED display server')
+@click.command(help='''OLED display server
+
+\b
+'@@@ scroll [False]': scroll mode on (off). The luma devices of the
+server scroll in software, hardware scroll needs the pigpio drivers
+(pigpio/Lcd.py)
+'@@@ stats': the statistics are logged and sent back as one line
+'STATS <json>' before the ACK (OledClient.stats())
+''')
 @click.argument('device', type=str, nargs=1)
 @click.option('--port',   '-p', 'port',   type=int, default=12345,
               help='port number')
@@ -315,9 +422,15 @@ class OledServer(socketserver.TCPServer):
               help='header lines')
 @click.option('--footer', '-f', 'footer', type=int, default=0,
               help='footer lines')
+@click.option('--async', '-a', 'async_flush', is_flag=True, default=False,
+              help='flush display in background thread')
+@click.option('--shm', '-s', 'shm', type=str, default=None,
+              help='shared memory framebuffer name (see OledShm.py)')
+@click.option('--rotate', '-r', 'rotate', type=click.IntRange(0, 3),
+              default=0, help='rotate x 90 degrees clockwise')
 @click.option('--debug', '-d', 'debug', is_flag=True, default=False,
               help='debug flag')
-def main(device, port, header, footer, debug):
+def main(device, port, header, footer, async_flush, shm, rotate, debug):
     global continueToServe
     continueToServe = True
 
@@ -328,7 +441,8 @@ def main(device, port, header, footer, debug):
     try:
         logger.debug('port=%d', port)
         server = OledServer(device, header, footer, port,
-                            OledHandler, OledWorker, debug=debug)
+                            OledHandler, OledWorker, async_flush=async_flush,
+                            shm=shm, rotate=rotate, debug=debug)
 
     except Exception as e:
         logger.error('Exception %s %s', type(e), e)
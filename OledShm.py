@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+OledShm.py
+
+Framebuffer in shared memory: another process renders into it and
+OledServer pushes only the committed regions to the panel.
+
+Layout of the segment:
+
+  offset  size
+       0     4  MAGIC
+       4     2  width
+       6     2  height
+       8     4  PIL mode, NUL padded ('1', 'L', 'RGB')
+      12     4  commit counter .. bumped by the writer
+      16     4  ack counter    .. the commit the server has pushed
+      20     8  dirty box (x0, y0, x1, y1), inclusive
+      32     -  pixels: rows of Image.tobytes() of the mode
+
+One writer at a time. The writer grows the dirty box while the server
+has not taken it yet, so no region is lost between two polls.
+
+Usage (client):
+
+--
+from OledShm import FrameBuffer
+
+fb = FrameBuffer('OledServer')      # attach
+img = fb.image()
+draw = ImageDraw.Draw(img)
+  :
+fb.write(img, (x0, y0, x1, y1))
+--
+"""
+__author__ = 'Yoichi Tanibayashi'
+__date__   = '2020'
+
+import time
+import struct
+import threading
+from multiprocessing import shared_memory
+from PIL import Image, ImageDraw
+from MyLogger import get_logger
+import click
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+
+class FrameBuffer:
+    DEF_NAME = 'OledServer'
+
+    MAGIC       = b'OLFB'
+    HEADER_FMT  = '<4sHH4s'
+    HEADER_SIZE = 32
+    OFF_COMMIT  = 12
+    OFF_ACK     = 16
+    OFF_BOX     = 20
+
+    def __init__(self, name=DEF_NAME, size=None, mode=None, create=False,
+                 debug=False):
+        """
+        create: True .. server side: make the segment of `size` and `mode`
+                False .. client side: attach to it
+        """
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('name   = %s', name)
+        self._log.debug('size   = %s', size)
+        self._log.debug('mode   = %s', mode)
+        self._log.debug('create = %s', create)
+
+        self.name   = name
+        self.create = create
+
+        if create:
+            self.size = size
+            self.mode = mode
+            self.stride = len(Image.new(mode, (size[0], 1)).tobytes())
+            nbytes = self.HEADER_SIZE + self.stride * size[1]
+
+            try:
+                self.shm = shared_memory.SharedMemory(name, create=True,
+                                                      size=nbytes)
+            except FileExistsError:
+                # left over by a server that was killed
+                self._log.warning('%s: exists: replaced', name)
+                old = shared_memory.SharedMemory(name)
+                old.close()
+                old.unlink()
+                self.shm = shared_memory.SharedMemory(name, create=True,
+                                                      size=nbytes)
+            self.buf = self.shm.buf
+            self.buf[:self.HEADER_SIZE] = bytes(self.HEADER_SIZE)
+            struct.pack_into(self.HEADER_FMT, self.buf, 0, self.MAGIC,
+                             size[0], size[1], mode.encode())
+            return
+
+        self.shm = shared_memory.SharedMemory(name)
+        try:
+            # the segment belongs to the server: do not let the
+            # resource tracker of this process unlink it at exit
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        except Exception as e:
+            self._log.debug('%s:%s', type(e).__name__, e)
+
+        self.buf = self.shm.buf
+        (magic, w, h, mode) = struct.unpack_from(self.HEADER_FMT, self.buf, 0)
+        if magic != self.MAGIC:
+            self.shm.close()
+            self._log.error('%s: not a framebuffer', name)
+            raise RuntimeError('%s: not a framebuffer' % name)
+        self.size = (w, h)
+        self.mode = mode.rstrip(b'\0').decode()
+        self.stride = len(Image.new(self.mode, (w, 1)).tobytes())
+        self._log.debug('size=%s, mode=%s', self.size, self.mode)
+
+    def close(self):
+        self._log.debug('')
+        self.buf = None
+        self.shm.close()
+        if self.create:
+            self.shm.unlink()
+
+    def _get(self, offset):
+        return struct.unpack_from('<I', self.buf, offset)[0]
+
+    def commits(self):
+        return self._get(self.OFF_COMMIT)
+
+    def pending(self):
+        """
+        True if a commit is not pushed yet
+        """
+        return self._get(self.OFF_COMMIT) != self._get(self.OFF_ACK)
+
+    def pixels(self):
+        """
+        memoryview of the pixel rows, for writers that render in place
+        """
+        return self.buf[self.HEADER_SIZE:]
+
+    def image(self):
+        """
+        a blank image to draw on, see write()
+        """
+        return Image.new(self.mode, self.size)
+
+    #
+    # client side
+    #
+    def write(self, img, box=None):
+        """
+        copy the rows of `box` of `img` into the framebuffer and commit
+
+        box: (x0, y0, x1, y1) .. inclusive, None: whole image
+        """
+        (w, h) = self.size
+        if box is None:
+            box = (0, 0, w - 1, h - 1)
+        (y0, y1) = (box[1], box[3])
+
+        data = img.crop((0, y0, w, y1 + 1)).tobytes()
+        offset = self.HEADER_SIZE + y0 * self.stride
+        self.buf[offset:offset + len(data)] = data
+
+        self.commit(box)
+
+    def commit(self, box=None):
+        """
+        tell the server that `box` was rewritten
+        """
+        (w, h) = self.size
+        if box is None:
+            box = (0, 0, w - 1, h - 1)
+
+        commit = self._get(self.OFF_COMMIT)
+        if commit != self._get(self.OFF_ACK):
+            # the last box has not been taken yet
+            old = struct.unpack_from('<4h', self.buf, self.OFF_BOX)
+            box = (min(old[0], box[0]), min(old[1], box[1]),
+                   max(old[2], box[2]), max(old[3], box[3]))
+
+        struct.pack_into('<4h', self.buf, self.OFF_BOX, *box)
+        struct.pack_into('<I', self.buf, self.OFF_COMMIT,
+                         (commit + 1) & 0xffffffff)
+
+    #
+    # server side
+    #
+    def update(self, ol):
+        """
+        copy the committed region into `ol.image` and mark it dirty
+
+        Returns the box, None: nothing new
+        """
+        commit = self._get(self.OFF_COMMIT)
+        if commit == self._get(self.OFF_ACK):
+            return None
+
+        (x0, y0, x1, y1) = struct.unpack_from('<4h', self.buf, self.OFF_BOX)
+        (w, h) = self.size
+        (x0, y0, x1, y1) = (max(x0, 0), max(y0, 0),
+                            min(x1, w - 1), min(y1, h - 1))
+        struct.pack_into('<I', self.buf, self.OFF_ACK, commit)
+        if x0 > x1 or y0 > y1:
+            return None
+
+        offset = self.HEADER_SIZE
+        rows = self.buf[offset + y0 * self.stride:
+                        offset + (y1 + 1) * self.stride]
+        img = Image.frombytes(self.mode, (w, y1 - y0 + 1), rows)
+        if self.mode != ol.image.mode:
+            img = img.convert(ol.image.mode)
+        ol.image.paste(img.crop((x0, 0, x1 + 1, y1 - y0 + 1)), (x0, y0))
+        ol.mark_dirty((x0, y0, x1, y1))
+
+        self._log.debug('commit=%d, box=%s', commit, (x0, y0, x1, y1))
+        return (x0, y0, x1, y1)
+
+
+class FrameBufferWatcher(threading.Thread):
+    """
+    poll the commit counter and call `notify()` once per new commit
+    """
+    def __init__(self, fb, notify, fps=30, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('fps = %s', fps)
+
+        self.fb     = fb
+        self.notify = notify
+        self.fps    = fps
+
+        self.running = False
+        super().__init__(daemon=True)
+
+    def end(self):
+        self._log.debug('')
+        self.running = False
+        self.join()
+
+    def run(self):
+        self._log.debug('start')
+
+        self.running = True
+        last = None
+        while self.running:
+            commit = self.fb.commits()
+            if commit != last and self.fb.pending():
+                last = commit
+                self.notify()
+            time.sleep(1 / self.fps)
+
+        self._log.debug('done')
+
+
+class Sample:
+    """
+    a clock rendered in this process, drawn by OledServer --shm
+    """
+    def __init__(self, name, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+
+        self.fb = FrameBuffer(name, debug=self._dbg)
+        self.img = self.fb.image()
+        self.draw = ImageDraw.Draw(self.img)
+
+    def main(self):
+        (w, h) = self.fb.size
+        self.fb.write(self.img)
+        while True:
+            box = (0, 0, w - 1, 11)
+            self.draw.rectangle(box, fill=0)
+            self.draw.text((0, 0), time.strftime('%H:%M:%S'), fill=255)
+            self.fb.write(self.img, box)
+            time.sleep(1.0 - time.time() % 1.0)
+
+    def finish(self):
+        self._log.debug('')
+        self.fb.close()
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--name', '-n', 'name', type=str, default=FrameBuffer.DEF_NAME,
+              help='shared memory name')
+@click.option('--debug', '-d', 'debug', is_flag=True, default=False,
+              help='debug flag')
+def main(name, debug):
+    log = get_logger(__name__, debug)
+    log.debug('name = %s', name)
+
+    obj = Sample(name, debug=debug)
+    try:
+        obj.main()
+    finally:
+        print('finally')
+        obj.finish()
+
+
+if __name__ == '__main__':
+    main()
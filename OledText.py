@@ -2,11 +2,15 @@
 # -*- coding: utf-8 -*-
 
 from Oled import Oled
-from PIL import ImageFont
+from PIL import Image, ImageDraw, ImageFont
 # import textwrap
 import mojimoji
 import unicodedata
 import time
+import threading
+import bisect
+import itertools
+import collections
 from ipaddr import ipaddr
 from MyLogger import get_logger
 import click
@@ -19,17 +23,243 @@ FONT_NAME = 'misaki_gothic.ttf'
 FONT_PATH = FONT_DIR + '/' + FONT_NAME
 
 
+class GlyphAtlas:
+    """
+    process-wide cache of rasterized glyphs
+
+    key:   (font path, font size, character, mask mode)
+    glyph: mask of one character cell
+
+    Every glyph of the font is small: nothing is evicted.
+    """
+    ASCII = ''.join([chr(c) for c in range(0x20, 0x7f)])
+    DIGIT = '0123456789０１２３４５６７８９'
+    KANA  = ''.join([chr(c) for c in list(range(0x3041, 0x3097)) +
+                     list(range(0x30a1, 0x30fd)) +
+                     list(range(0xff61, 0xffa0))])
+
+    def __init__(self, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+
+        self.glyphs = {}
+        self.lock = threading.Lock()
+
+        self.hits   = 0
+        self.misses = 0
+        self.warmed = 0
+
+    def get(self, font, ch, cell, mode, warm=False):
+        """
+        the mask of `ch` in a cell of `cell` (w, h) pixels
+
+        warm: True .. warm-up, not counted as hit nor miss
+        """
+        key = (font.path, font.size, ch, mode)
+        glyph = self.glyphs.get(key)
+        if glyph is not None:
+            if not warm:
+                self.hits += 1
+            return glyph
+
+        glyph = Image.new(mode, cell)
+        ImageDraw.Draw(glyph).text((0, 0), ch, fill=255, font=font)
+        with self.lock:
+            glyph = self.glyphs.setdefault(key, glyph)
+            if warm:
+                self.warmed += 1
+            else:
+                self.misses += 1
+        return glyph
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'warmed': self.warmed, 'glyphs': len(self.glyphs)}
+
+
+glyph_atlas = GlyphAtlas()
+
+
+class TextWrap:
+    """
+    width of text and line wrapping
+
+    width: in half width cells, 2 .. east asian width F, W, A
+                                1 .. the others
+    The widths of the BMP are looked up in a table built once.
+    wrap() results are kept in a LRU of `cache_size` entries.
+    """
+    WIDE       = 'FWA'
+    CACHE_SIZE = 256
+
+    _table = None       # bytearray: width of U+0000 .. U+FFFF
+
+    def __init__(self, cache_size=CACHE_SIZE, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('cache_size = %d', cache_size)
+
+        self.cache_size = cache_size
+
+        if __class__._table is None:
+            t0 = time.monotonic()
+            __class__._table = bytearray(
+                [2 if unicodedata.east_asian_width(chr(c)) in self.WIDE
+                 else 1 for c in range(0x10000)])
+            self._log.debug('table: %.3f sec', time.monotonic() - t0)
+        self.table = __class__._table
+
+        self.cache = collections.OrderedDict()
+        self.hits   = 0
+        self.misses = 0
+
+    def ch_width(self, ch):
+        c = ord(ch)
+        if c < 0x10000:
+            return self.table[c]
+        if unicodedata.east_asian_width(ch) in self.WIDE:
+            return 2
+        return 1
+
+    def widths(self, text):
+        try:
+            return list(map(self.table.__getitem__, map(ord, text)))
+        except IndexError:
+            # out of the BMP
+            return [self.ch_width(ch) for ch in text]
+
+    def measure(self, text):
+        """
+        width of `text` in half width cells
+        """
+        if text.isascii():
+            return len(text)
+        return sum(self.widths(text))
+
+    def wrap(self, text, cols):
+        """
+        split `text` into lines of `cols` full width cells at most
+        (cols >= 1)
+
+        Returns a tuple of the lines, () for ''
+        """
+        key = (text, cols)
+        lines = self.cache.get(key)
+        if lines is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return lines
+        self.misses += 1
+
+        limit = int(cols * 2)
+        if text.isascii():
+            lines = tuple([text[i:i + limit]
+                           for i in range(0, len(text), limit)])
+        else:
+            # cum[i]: width of text[:i]
+            cum = list(itertools.accumulate(self.widths(text), initial=0))
+            lines = []
+            start = 0
+            while start < len(text):
+                end = bisect.bisect_right(cum, cum[start] + limit) - 1
+                lines.append(text[start:end])
+                start = end
+            lines = tuple(lines)
+
+        self.cache[key] = lines
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return lines
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.cache)}
+
+
+class TextNormalizer:
+    """
+    text of a part as it is drawn, cached
+
+    get() returns Normalized(text, width, lines):
+      text:  zenkaku converted (mojimoji.han_to_zen and `trans_tbl`)
+             if asked, else as it is
+      width: in half width cells, see TextWrap
+      lines: wrap points, see TextWrap.wrap()
+
+    ASCII text is converted by one translate() with a table of both
+    steps. The results are kept in a LRU of `cache_size` entries.
+    """
+    CACHE_SIZE = 256
+
+    Normalized = collections.namedtuple('Normalized', 'text width lines')
+
+    def __init__(self, textwrap, trans_tbl, cache_size=CACHE_SIZE,
+                 debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('cache_size = %d', cache_size)
+
+        self.textwrap   = textwrap
+        self.trans_tbl  = trans_tbl
+        self.cache_size = cache_size
+
+        # han_to_zen() is one to one for ASCII
+        self.ascii_tbl = str.maketrans(
+            {chr(c): mojimoji.han_to_zen(chr(c)).translate(trans_tbl)
+             for c in range(0x80)})
+
+        self.cache = collections.OrderedDict()
+        self.hits   = 0
+        self.misses = 0
+
+    def zenkaku(self, text):
+        if text.isascii():
+            return text.translate(self.ascii_tbl)
+        return mojimoji.han_to_zen(text).translate(self.trans_tbl)
+
+    def get(self, text, zenkaku, cols):
+        key = (text, zenkaku, cols)
+        norm = self.cache.get(key)
+        if norm is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return norm
+        self.misses += 1
+
+        if zenkaku:
+            text = self.zenkaku(text)
+        norm = self.Normalized(text, self.textwrap.measure(text),
+                               self.textwrap.wrap(text, cols))
+
+        self.cache[key] = norm
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return norm
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.cache)}
+
+
 class OledPart:
     """
     part: 'header', 'body', 'footer'
+
+    The text of the rows is kept in `line`. What differs from the
+    pixels is kept until the next render:
+
+      changed: rows to repaint
+      shift:   lines scrolled up
     """
-    def __init__(self, disp_row, rows=0, zenkaku=True, crlf=True, debug=False):
+    def __init__(self, disp_row, rows=0, zenkaku=True, crlf=True,
+                 scroll=False, debug=False):
         self._dbg = debug
         self._log = get_logger(__class__.__name__, self._dbg)
         self._log.debug('disp_row=%d', disp_row)
         self._log.debug('rows    =%d', rows)
         self._log.debug('zenkaku =%s', zenkaku)
         self._log.debug('crlf    =%s', crlf)
+        self._log.debug('scroll  =%s', scroll)
 
         self.enable = True
 
@@ -38,6 +268,7 @@ class OledPart:
 
         self.zenkaku  = zenkaku
         self.crlf     = crlf
+        self.scroll   = scroll
 
         self.cur_row  = 0
         self.clear()		# self.line[]
@@ -46,18 +277,42 @@ class OledPart:
         self.line = [''] * self.rows
         self.cur_row = 0
 
+        # the pixels are not known: repaint every row
+        self.changed = set(range(self.rows))
+        self.shift   = 0
+
+    def rendered(self):
+        """
+        the pixels are up to date
+        """
+        self.changed = set()
+        self.shift   = 0
+
     def writeline(self, text):
+        """
+        return True if the lines were scrolled up
+        """
+        scrolled = False
         if self.cur_row > self.rows - 1:
             self.cur_row = self.rows - 1
             if self.crlf:
                 self.line.pop(0)
                 self.line.append('')
+                scrolled = True
+
+                # the new bottom row is blanked by the scroll
+                self.shift += 1
+                self.changed = set([r - 1 for r in self.changed if r > 0])
 
-        self.line[self.cur_row] = text
+        if self.line[self.cur_row] != text:
+            self.line[self.cur_row] = text
+            self.changed.add(self.cur_row)
 
         if self.crlf:
             self.cur_row += 1
 
+        return scrolled
+
 
 class OledText:
     """
@@ -67,7 +322,14 @@ class OledText:
     TRANS_DST = ' .､,-+*/\'\"`:;()[]<>#$%&@\\'
 
     def __init__(self, device='ssd1306', headerlines=0, footerlines=0,
-                 zenkaku=False, fontsize=8, rst=24, debug=False):
+                 zenkaku=False, fontsize=8, rst=24, async_flush=False,
+                 oled=None, rotate=0, warmup=True, debug=False):
+        """
+        oled:   display object with the Oled interface (Oled, pigpio Lcd)
+                None: Oled(device)
+        rotate: x 90 degrees clockwise, see Oled
+        warmup: rasterize ASCII, digits and kana in advance
+        """
         self._dbg = debug
         self._log = get_logger(__class__.__name__, self._dbg)
         self._log.debug('device      = %s', device)
@@ -76,6 +338,9 @@ class OledText:
         self._log.debug('zenkaku     = %s', zenkaku)
         self._log.debug('fontsize    = %d', fontsize)
         self._log.debug('rst         = %d', rst)
+        self._log.debug('async_flush = %s', async_flush)
+        self._log.debug('rotate      = %d', rotate)
+        self._log.debug('warmup      = %s', warmup)
 
         self.device   = device
         self.enable   = True
@@ -85,9 +350,14 @@ class OledText:
 
         self.trans_tbl = str.maketrans(__class__.TRANS_SRC,
                                        __class__.TRANS_DST)
+        self.textwrap = TextWrap(debug=self._dbg)
+        self.normalizer = TextNormalizer(self.textwrap, self.trans_tbl,
+                                         debug=self._dbg)
 
         # initialize display
-        self.oled = Oled(device)
+        self.oled = oled
+        if self.oled is None:
+            self.oled = Oled(device, async_flush=async_flush, rotate=rotate)
 
         # clear display
         self.oled.disp.clear()
@@ -98,6 +368,14 @@ class OledText:
         (self.ch_w, self.ch_h) = self.font.getsize('８')
         self.ch_h += 1
 
+        # glyphs are blitted from the atlas as masks of the canvas
+        self.atlas = glyph_atlas
+        self.glyph_mode = 'L'
+        if self.oled.image.mode == '1':
+            self.glyph_mode = '1'
+        if warmup:
+            self.warmup(GlyphAtlas.ASCII + GlyphAtlas.DIGIT + GlyphAtlas.KANA)
+
         # physical cols and rows
         self.disp_cols = int(self.oled.disp.width  / self.ch_w)
         self.disp_rows = int(self.oled.disp.height / self.ch_h)
@@ -111,6 +389,33 @@ class OledText:
     def close(self):
         self.oled.cleanup()
 
+    def stats(self):
+        return {'glyph_atlas': self.atlas.stats(),
+                'textwrap': self.textwrap.stats(),
+                'normalizer': self.normalizer.stats()}
+
+    def warmup(self, chars):
+        """
+        put the glyphs of `chars` in the atlas
+        """
+        t0 = time.monotonic()
+        for ch in chars:
+            self._glyph(ch, warm=True)
+        self._log.debug('%d chars: %.3f sec', len(chars),
+                        time.monotonic() - t0)
+
+    def _cell_w(self, ch):
+        """
+        full width characters take a whole cell, the others half
+        """
+        if self.textwrap.ch_width(ch) == 2:
+            return self.ch_w
+        return self.ch_w // 2
+
+    def _glyph(self, ch, warm=False):
+        return self.atlas.get(self.font, ch, (self._cell_w(ch), self.ch_h),
+                              self.glyph_mode, warm)
+
     def set_layout(self, header_lines=0, footer_lines=0, display_now=True):
         """
         set header and footer
@@ -148,12 +453,15 @@ class OledText:
     def _display(self, display_now=True):
         """
         output physical display
+
+        Returns False if the frame was dropped
         """
         if not self.enable:
-            return
+            return True
 
         if display_now:
-            self.oled.display()
+            return self.oled.display()
+        return True
 
     def _draw_border(self, width=2, display_now=False):
         """
@@ -201,11 +509,13 @@ class OledText:
 
         # clear part area
         self._clear(part)
+        self.part[part].rendered()
 
         # display
         self._display(display_now)
 
-    def set_part(self, part='body', row=-1, zenkaku=None, crlf=None):
+    def set_part(self, part='body', row=-1, zenkaku=None, crlf=None,
+                 scroll=None):
         """
         select current part
         """
@@ -226,6 +536,9 @@ class OledText:
         if crlf is not None:
             self.part[part].crlf = crlf
 
+        if scroll is not None:
+            self.part[part].scroll = scroll
+
     def set_row(self, row, part=''):
         """
         set part and row
@@ -253,10 +566,38 @@ class OledText:
 
         self.set_part(part, crlf=crlf)
 
+    def set_scroll(self, scroll, part=''):
+        """
+        scroll mode: let the controller scroll the part when it is full
+        (hardware scroll), see Oled.scroll()
+
+        Only the pigpio drivers do it (oled=Lcd(..), SSD1306 and ST7789).
+        With Oled (luma) the part is scrolled in software as without
+        scroll mode.
+        """
+        if part == '':
+            part = self.cur_part
+
+        self.set_part(part, scroll=scroll)
+
     def _draw_1line(self, disp_row, text, fill='white'):
+        """
+        blit the glyphs of `text` from the atlas: one mask for the line
+        """
+        if len(text) == 0:
+            return
+
+        glyphs = [self._glyph(ch) for ch in text]
+        mask = Image.new(self.glyph_mode,
+                         (sum([g.width for g in glyphs]), self.ch_h))
+        x = 0
+        for g in glyphs:
+            mask.paste(g, (x, 0))
+            x += g.width
+
         x1, y1 = 0, disp_row * self.ch_h
-        self.oled.draw.text((x1, y1), text, font=self.font, fill=self.color)
-        self._log.debug('draw.text(%d, %d)', x1, y1)
+        self.oled.draw.bitmap((x1, y1), mask, fill=self.color)
+        self._log.debug('draw.bitmap(%d, %d)', x1, y1)
 
     def _draw_part(self, part=''):
         if part == '':
@@ -271,9 +612,63 @@ class OledText:
             self._draw_1line(disp_row, txt)
             disp_row += 1
 
-    def _print_1line(self, text, part='', crlf=None):
+        self.part[part].rendered()
+
+    def _render_part(self, part=''):
+        """
+        bring the pixels of the part up to date: shift them if the lines
+        were scrolled, then repaint only the changed rows
+        """
+        if part == '':
+            part = self.cur_part
+        p = self.part[part]
+
+        if p.shift >= p.rows:
+            # every row has been replaced
+            self._draw_part(part)
+            return
+
+        if p.shift > 0:
+            self._shift_part(part, p.shift)
+
+        for row in sorted(p.changed):
+            self._clear_row(p.disp_row + row)
+            self._draw_1line(p.disp_row + row, p.line[row])
+
+        p.rendered()
+
+    def _shift_part(self, part, lines):
+        """
+        move the pixels of the part up by `lines` with one region copy
+        and blank the rows below.
+
+        In scroll mode the controller may do it, see Oled.scroll()
+        """
+        top  = self.ch_h * self.part[part].disp_row
+        rows = self.ch_h * self.part[part].rows
+        dy   = self.ch_h * lines
+
+        if self.part[part].scroll:
+            self.oled.scroll(top, rows, dy)
+            return
+
+        img = self.oled.image
+        band = img.crop((0, top + dy, img.width, top + rows))
+        img.paste(band, (0, top))
+        img.paste(0, (0, top + rows - dy, img.width, top + rows))
+        self.oled.mark_dirty((0, top, img.width - 1, top + rows - 1))
+
+    def _clear_row(self, disp_row):
+        img = self.oled.image
+        (y1, y2) = (self.ch_h * disp_row, self.ch_h * (disp_row + 1) - 1)
+        img.paste(0, (0, y1, img.width, y2 + 1))
+        self.oled.mark_dirty((0, y1, img.width - 1, y2))
+
+    def _print_1line(self, text, part='', crlf=None, render=True):
         """
         1行分出力し、crlfフラグに応じてスクロール処理も行う
+
+        render: False .. only the text of the part, see _render_part()
         """
         self._log.debug('part=%s crlf=%s text=\'%s\'', part, crlf, text)
 
@@ -291,7 +686,8 @@ class OledText:
         self.part[part].writeline(text)
 
         # (text[]上での変更を反映: only draw, not display yet
-        self._draw_part(part)
+        if render:
+            self._render_part(part)
 
     def print(self, text, part='', crlf=None, display_now=True):
         """
@@ -311,39 +707,58 @@ class OledText:
             self._print_1line('', part=part, crlf=crlf)
             return
 
-        if self.part[part].zenkaku:
-            text = mojimoji.han_to_zen(text).translate(self.trans_tbl)
-
-        # 長い行は折り返し
-        # crlfがFalseの場合は、最初の1行だけ出力
-        line = ''
-        zenkaku_len = 0
-        for ch in text:
-            if unicodedata.east_asian_width(ch) in 'FWA':
-                ch_len = 1
-            else:
-                ch_len = 0.5
+        if self.part[part].rows < 1:
+            return
 
-            if zenkaku_len + ch_len > self.disp_cols:
-                self._log.debug('line=%s zenkaku_len=%.1f ch_len=%.1f',
-                                line, zenkaku_len, ch_len)
-                self._print_1line(line, part=part, crlf=crlf)
+        # all the wrapped lines are drawn at once
+        self._print_text(text, part, crlf)
+        self._render_part(part)
 
-                line = ''
-                zenkaku_len = 0
+        # display OLED
+        self._display(display_now)
 
-                if not crlf:
-                    break
+    def print_lines(self, lines, part='', crlf=None, display_now=True):
+        """
+        print() every text of `lines`, but draw only the final state of
+        the part and display once
+        """
+        if part == '':
+            part = self.cur_part
+        if crlf is None:
+            crlf = self.part[part].crlf
+        self.part[part].crlf = crlf
+        self._log.debug('part=%s crlf=%s', part, crlf)
 
-            line += ch
-            zenkaku_len += ch_len
+        if self.part[part].rows < 1:
+            return
 
-        if zenkaku_len > 0:
-            self._print_1line(line, part=part, crlf=crlf)
+        n = 0
+        for text in lines:
+            if len(text) == 0:
+                self._print_1line('', part=part, crlf=crlf, render=False)
+            else:
+                self._print_text(text, part, crlf)
+            n += 1
+        self._log.debug('%d lines', n)
 
-        # display OLED
+        self._render_part(part)
         self._display(display_now)
 
+    def _print_text(self, text, part, crlf):
+        """
+        長い行を折り返して part の text に書く (draw しない)
+        """
+        norm = self.normalizer.get(text, self.part[part].zenkaku,
+                                   self.disp_cols)
+
+        # 長い行は折り返し
+        # crlfがFalseの場合は、最初の1行だけ出力
+        lines = norm.lines
+        if not crlf:
+            lines = lines[:1]
+        for line in lines:
+            self._print_1line(line, part=part, crlf=crlf, render=False)
+
 
 @click.command(context_settings=CONTEXT_SETTINGS,
                help='OLED Text library')
@@ -396,6 +811,7 @@ def main(display, debug):
     ot.clear('body')
     time.sleep(2)
     ot.clear('header')
+    _log.info('stats:  %s', ot.stats())
     ot.close()
 
 
@@ -2,12 +2,11 @@
 #
 # (c) 2019 Yoichi Tanibayashi
 #
-import time
 import threading
 import RPi.GPIO as GPIO
 from PIL import Image, ImageDraw, ImageFont
 
-from Oled import Oled
+from Oled import Oled, FrameScheduler, StaticLayer, Scene, Sprite
 from RotaryEncoder import RotaryEncoder, RotaryEncoderListener
 
 import click
@@ -47,8 +46,12 @@ class Frame:
         (self.x2, self.y2) = (self.ol.disp.width - 1, self.ol.disp.height - 1)
 
     def draw(self):
+        """
+        the frame is the static layer of the scene: draw it once
+        """
         xy = [(self.x1, self.y1), (self.x2, self.y2)]
         self.ol.draw.rectangle(xy, outline=self.color, width=self.w, fill=0)
+        self.ol.show_layer(StaticLayer(self.ol, self.ol.image))
 
 class Bar:
     def __init__(self, ol, color, xy, l, debug=False):
@@ -63,6 +66,10 @@ class Bar:
         (self.x, self.y) = xy
         self.l           = l
 
+        # line width 2
+        self.sprite = Sprite(Image.new(self.ol.image.mode,
+                                       (int(l/2) * 2 + 1, 2), color))
+
         self.lock = threading.Lock()
 
     def move(self, v):
@@ -75,11 +82,8 @@ class Bar:
         self.lock.acquire()
 
         x1 = self.x - int(self.l/2)
-        x2 = self.x + int(self.l/2)
+        self.sprite.move_to(x1, self.y)
 
-        self.ol.draw.line([(x1, self.y), (x2, self.y)],
-                          fill=self.color, width=2)
-        
         self.lock.release()
 
 class Ball:
@@ -98,6 +102,9 @@ class Ball:
         self.r             = r
         (self.vx, self.vy) = v
 
+        self.sprite = Sprite(Image.new(self.ol.image.mode, (r + 1, r + 1),
+                                       color))
+
         self.lock = threading.Lock()
 
     def check_frame(self):
@@ -209,15 +216,13 @@ class Ball:
         
         x1 = round(self.x - self.r / 2)
         y1 = round(self.y - self.r / 2)
-        x2 = x1 + self.r
-        y2 = y1 + self.r
+        self.sprite.move_to(x1, y1)
 
-        self.ol.draw.rectangle([(x1, y1), (x2, y2)],
-                               outline=self.color, fill=self.color)
-        
         self.lock.release()
 
 class App:
+    FPS = 30
+
     def __init__(self, dev, pin_re, pin_sw, debug=False):
         self.logger = init_logger(__class__.__name__, debug)
         self.debug = debug
@@ -228,6 +233,7 @@ class App:
         GPIO.setmode(GPIO.BCM)
 
         self.dev  = dev
+        self.fs   = None
         
         self.ol = Oled(self.dev, debug=False)
         self.re = RotaryEncoderListener(pin_re, self.cb_re, debug=False)
@@ -250,19 +256,20 @@ class App:
                               (5, 10), 3, (2, -2),
                               debug=self.debug))
 
+        self.scene = Scene(self.ol, debug=self.debug)
+        for b in self.ball:
+            self.scene.add(b.sprite)
+        self.scene.add(self.bar.sprite)
+
         self.frame.draw()
-        for i in range(len(self.ball)):
-            self.ball[i].draw()
+        self.draw()
         self.ol.display()
 
     def main(self):
-        disp_th = threading.Thread(target=self.move, daemon=True)
-        disp_th.start()
-
-        while True:
-            self.draw()
-            self.ol.display()
-            time.sleep(0.01)
+        self.fs = FrameScheduler(self.ol, self.FPS, update=self.move,
+                                 render=self.draw, update_fps=1 / 0.1,
+                                 debug=self.debug)
+        self.fs.run()
                 
     def cb_re(self, val):
         self.logger.debug('val = %s', RotaryEncoder.val2str(val))
@@ -278,20 +285,20 @@ class App:
             self.bar.x = self.ol.disp.width - 1
 
     def move(self):
-        while True:
-            for b in self.ball:
-                b.move()
-                
-            time.sleep(.1)
+        for b in self.ball:
+            b.move()
 
     def draw(self):
-        self.frame.draw()
         for b in self.ball:
             b.draw()
         self.bar.draw()
+        self.scene.compose()
 
     def finish(self):
         self.logger.debug('')
+        if self.fs is not None:
+            self.logger.info('frame: %s', self.fs.stats())
+        self.logger.info('scene: %s', self.scene.stats())
         self.ol.cleanup()
         GPIO.cleanup()
 
@@ -0,0 +1,112 @@
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+FakePi.py
+
+Stand-in for pigpio.pi() without hardware: models the time a pigpiod
+call takes, so that benchmarks and calibration can run anywhere.
+
+  call:  socket round trip to pigpiod (`call_sec`)
+  I2C:   start + address + stop, 9 clocks per byte at `i2c_hz`
+  SPI:   8 clocks per byte at the `baud` of spi_open(),
+         split into transfers of `spi_bufsiz` bytes (spidev buffer)
+         costing `xfer_sec` each
+
+Usage:
+
+--
+from FakePi import FakePi
+
+pi = FakePi()
+disp = SSD1306(pi, 1, 0x3c)
+--
+"""
+__author__ = 'Yoichi Tanibayashi'
+__date__   = '2020'
+
+import time
+
+
+class FakePi:
+    CALL_SEC   = 0.000150   # pigpiod socket round trip
+    XFER_SEC   = 0.000040   # setup of one SPI transfer
+    I2C_HZ     = 400000
+    SPI_BUFSIZ = 4096
+
+    def __init__(self, call_sec=CALL_SEC, xfer_sec=XFER_SEC, i2c_hz=I2C_HZ,
+                 spi_bufsiz=SPI_BUFSIZ):
+        self.call_sec   = call_sec
+        self.xfer_sec   = xfer_sec
+        self.i2c_hz     = i2c_hz
+        self.spi_bufsiz = spi_bufsiz
+
+        self.connected = True
+
+        self.calls = 0
+        self.bytes = 0
+
+        self._baud = {}
+        self._debt = 0.0
+
+    def _spend(self, sec):
+        """
+        sleep for `sec`, batching short waits so that the modeled time
+        is kept on average
+        """
+        self._debt += sec
+        if self._debt < 0.001:
+            return
+
+        t0 = time.perf_counter()
+        time.sleep(self._debt)
+        self._debt -= time.perf_counter() - t0
+
+    def _call(self, sec=0.0, nbytes=0):
+        self.calls += 1
+        self.bytes += nbytes
+        self._spend(self.call_sec + sec)
+
+    def stop(self):
+        self.connected = False
+
+    def set_mode(self, gpio, mode):
+        self._call()
+
+    def write(self, gpio, level):
+        self._call()
+
+    # I2C
+    def i2c_open(self, i2c_bus, i2c_addr, i2c_flags=0):
+        self._call()
+        return 0
+
+    def i2c_close(self, handle):
+        self._call()
+
+    def _i2c_sec(self, nbytes):
+        # start + address + stop + 9 clocks per byte
+        return (2 + 9 * (nbytes + 1)) / self.i2c_hz
+
+    def i2c_write_i2c_block_data(self, handle, reg, data):
+        n = len(data) + 1
+        self._call(self._i2c_sec(n), n)
+
+    def i2c_write_device(self, handle, data):
+        n = len(data)
+        self._call(self._i2c_sec(n), n)
+
+    # SPI
+    def spi_open(self, spi_channel, baud, spi_flags=0):
+        self._call()
+        self._baud[spi_channel] = baud
+        return spi_channel
+
+    def spi_close(self, handle):
+        self._call()
+
+    def spi_write(self, handle, data):
+        n = len(data)
+        xfers = (n + self.spi_bufsiz - 1) // self.spi_bufsiz
+        sec = xfers * self.xfer_sec + 8 * n / self._baud[handle]
+        self._call(sec, n)
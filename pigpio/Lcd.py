@@ -4,17 +4,94 @@
 #
 import pigpio
 import time
-import copy
 import threading
 from SSD1306 import SSD1306
 from SSD1331 import SSD1331
 from ST7789 import ST7789
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageChops
 from MyLogger import get_logger
 import click
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
+class RetryPolicy:
+    """
+    display() retry policy
+
+    max_retry:    retries before the frame is dropped
+    wait_sec:     first backoff, multiplied by `factor` on every retry
+    max_wait_sec: backoff limit
+    reopen_after: consecutive errors before reopening the interface
+    """
+    def __init__(self, max_retry=5, wait_sec=0.1, factor=2.0,
+                 max_wait_sec=2.0, reopen_after=3):
+        self.max_retry    = max_retry
+        self.wait_sec     = wait_sec
+        self.factor       = factor
+        self.max_wait_sec = max_wait_sec
+        self.reopen_after = max(reopen_after, 1)
+
+    def wait(self, n):
+        """
+        backoff before the (n + 1)th retry
+        """
+        return min(self.wait_sec * self.factor ** n, self.max_wait_sec)
+
+
+class DirtyDraw:
+    """
+    ImageDraw wrapper: report the bounding box of every drawing call
+    to `mark_dirty(box)`
+    """
+    SHAPES = ['arc', 'chord', 'ellipse', 'line', 'pieslice', 'point',
+              'polygon', 'rectangle', 'rounded_rectangle']
+
+    def __init__(self, image, mark_dirty):
+        self._draw = ImageDraw.Draw(image)
+        self._mark_dirty = mark_dirty
+
+    def __getattr__(self, name):
+        func = getattr(self._draw, name)
+        if name not in self.SHAPES:
+            return func
+
+        def shape(xy, *args, **kwargs):
+            self._mark_dirty(self.xy_box(xy, kwargs.get('width', 1)))
+            return func(xy, *args, **kwargs)
+
+        return shape
+
+    @staticmethod
+    def xy_box(xy, width=1):
+        """
+        [(x1, y1), (x2, y2), ..] or [x1, y1, x2, y2, ..] -> (x0, y0, x1, y1)
+        """
+        if isinstance(xy[0], (tuple, list)):
+            xs = [p[0] for p in xy]
+            ys = [p[1] for p in xy]
+        else:
+            xs = xy[0::2]
+            ys = xy[1::2]
+        w = int(width or 1) // 2 + 1
+        return (int(min(xs)) - w, int(min(ys)) - w,
+                int(max(xs)) + w, int(max(ys)) + w)
+
+    def text(self, xy, text, fill=None, font=None, *args, **kwargs):
+        if hasattr(self._draw, 'textbbox'):
+            (x0, y0, x1, y1) = self._draw.textbbox(xy, text, font=font)
+        else:
+            (w, h) = self._draw.textsize(text, font=font)
+            (x0, y0, x1, y1) = (xy[0], xy[1], xy[0] + w, xy[1] + h)
+        self._mark_dirty((int(x0), int(y0), int(x1), int(y1)))
+        return self._draw.text(xy, text, fill, font, *args, **kwargs)
+
+    def bitmap(self, xy, bitmap, fill=None):
+        self._mark_dirty((int(xy[0]), int(xy[1]),
+                          int(xy[0]) + bitmap.size[0] - 1,
+                          int(xy[1]) + bitmap.size[1] - 1))
+        return self._draw.bitmap(xy, bitmap, fill)
+
+
 class Lcd:
     '''
 LCD
@@ -40,20 +117,45 @@ SPI pins
     SPI_RST = 25
     SPI_CS  = 8
 
-    def __init__(self, pi, dev, param1=-1, param2=-1, debug=False):
+    DIRTY_MAX = 4  # max number of dirty boxes kept before merging
+
+    def __init__(self, pi, dev, param1=-1, param2=-1, retry=None, rotate=0,
+                 debug=False):
+        """
+        retry:  RetryPolicy, None: RetryPolicy()
+        rotate: x 90 degrees clockwise, done by the controller
+                (ssd1306: 0 or 2 only)
+        """
         self._dbg = debug
         self._log = get_logger(__class__.__name__, self._dbg)
         self._log.debug('dev    = %s',   dev)
         self._log.debug('param1 = %d',   param1)
         self._log.debug('param2 = %d(0x%X)', param2, param2)
+        self._log.debug('rotate = %d',   rotate)
 
         self.pi     = pi
         self.dev    = dev
         self.param1 = param1
         self.param2 = param2
+        self.rotate = rotate
 
         self.enable = False
 
+        self.retry = retry
+        if self.retry is None:
+            self.retry = RetryPolicy()
+
+        self.bus_errors = 0     # exceptions from the driver
+        self.err_seq = 0        # consecutive errors
+        self.err_time = None    # time of the first error in sequence
+        self.reopens = 0
+        self.recoveries = 0
+        self.recovery_sec = 0.0
+        self.failed = 0         # frames given up after retries
+        self.resync = False     # panel content unknown: push everything
+        self.shown = None       # copy of the frame on the panel
+        self.skipped = 0        # display() calls with an identical frame
+
         if param1 < 0:
             if dev in self.I2C_DEV:
                 self.param1 = 1
@@ -89,36 +191,75 @@ SPI pins
     def open(self):
         self._log.debug('')
 
-        self.disp = None
-        self.disp_size = None
-        self.mode = ''
+        self.open_disp()
+
+        self.image = Image.new(self.disp.color_mode, self.disp.size)
+        self.draw  = DirtyDraw(self.image, self.mark_dirty)
+
+        self.dirty = []
+        self.layer = None       # StaticLayer under the drawings
+        self.overlay = []       # boxes drawn on top of self.layer
+        self.mark_dirty()
+
+        # self.clear()
+
+        return self
+
+    def open_disp(self):
+        """
+        open the device.
+        self.disp is replaced only when the new device is ready:
+        on failure the old one is kept
+        """
+        self._log.debug('')
+
+        disp = None
 
         if self.dev == 'ssd1306':
             if self.param2 == 0:
                 self.param2 = self.I2C_ADDR
-            self.disp = SSD1306(self.pi, self.param1, self.param2,
-                                debug=self._dbg)
-            self.disp.begin()
+            disp = SSD1306(self.pi, self.param1, self.param2,
+                           rotate=self.rotate, debug=self._dbg)
+            disp.begin()
 
         if self.dev == 'ssd1331':
-            self.disp = SSD1331(self.pi)
-            self.disp.begin()
+            disp = SSD1331(self.pi, rotate=self.rotate)
+            disp.begin()
 
         if self.dev == 'st7789':
-            self.disp = ST7789(self.pi)
-            self.disp.begin()
+            disp = ST7789(self.pi, rotate=self.rotate)
+            disp.begin()
 
-        if self.disp is None:
+        if disp is None:
             self._log.error('invalid device: %s', self.dev)
             raise RuntimeError('invalid device: %s' % self.dev)
-        self.disp.persist = True
+        disp.persist = True
 
-        self.image = Image.new(self.disp.color_mode, self.disp.size)
-        self.draw  = ImageDraw.Draw(self.image)
+        self.disp = disp
 
-        # self.clear()
+    def reopen(self):
+        """
+        reopen the device after bus errors.
+        The old device stays in self.disp if it fails: the next try
+        of _send() uses it and counts as an error again
+        """
+        self._log.warning('reopen %s', self.dev)
+        self.reopens += 1
 
-        return self
+        try:
+            self.disp.cleanup()
+        except Exception as e:
+            self._log.debug('%s:%s', type(e).__name__, e)
+
+        try:
+            self.open_disp()
+        except Exception as e:
+            self._log.error('%s:%s', type(e).__name__, e)
+            return False
+
+        # the panel content is unknown
+        self.resync = True
+        return True
 
     def available(self):
         if self.enable:
@@ -150,19 +291,241 @@ SPI pins
         if display_now:
             self.display()
 
+    def mark_dirty(self, box=None):
+        """
+        box: (x0, y0, x1, y1) .. inclusive, None: whole display
+        """
+        (w, h) = self.image.size
+        if box is None:
+            box = (0, 0, w - 1, h - 1)
+
+        (x0, y0, x1, y1) = box
+        box = (max(x0, 0), max(y0, 0), min(x1, w - 1), min(y1, h - 1))
+        if box[0] > box[2] or box[1] > box[3]:
+            return
+
+        self.dirty = merge_box(self.dirty, box, self.DIRTY_MAX)
+        if self.layer is not None:
+            self.overlay = merge_box(self.overlay, box, self.DIRTY_MAX)
+
+    def show_layer(self, layer):
+        """
+        put `layer` (StaticLayer) under the canvas: self.image is
+        replaced with it and the next display() pushes the whole frame,
+        from the native bytes of the layer if the driver takes them.
+
+        layer: None .. forget the layer
+        """
+        self.layer = layer
+        self.overlay = []
+        if layer is None:
+            return
+
+        self.image.paste(layer.image, (0, 0))
+        (w, h) = self.image.size
+        self.dirty = [(0, 0, w - 1, h - 1)]
+
+    def restore_layer(self):
+        """
+        erase what was drawn since the last call by copying the
+        static layer back into those boxes only
+        """
+        if self.layer is None:
+            return
+
+        for box in self.overlay:
+            (x0, y0, x1, y1) = box
+            region = (x0, y0, x1 + 1, y1 + 1)
+            self.image.paste(self.layer.image.crop(region), region)
+            self.dirty = merge_box(self.dirty, box, self.DIRTY_MAX)
+        self.overlay = []
+
+    def layer_data(self, boxes):
+        """
+        native bytes of the static layer if the frame is pushed as a
+        whole, else None.
+        What was drawn on the layer (overlay) is sent after it as
+        windows, see display()
+        """
+        if self.layer is None or self.layer.data is None:
+            return None
+
+        (w, h) = self.image.size
+        if boxes != [(0, 0, w - 1, h - 1)]:
+            return None
+        return self.layer.data
+
     def display(self, img=None):
+        """
+        img: None .. push only the dirty boxes of self.image
+
+        Only the parts of the dirty boxes that differ from the frame on
+        the panel are sent. Nothing is sent if no pixel differs (counted
+        as `skipped`).
+
+        Returns False if the frame was dropped after the retries of
+        the retry policy.
+        """
         self._log.debug('')
 
+        if self.resync:
+            self.resync = False
+            self.shown = None
+            self.mark_dirty()
+
+        boxes = self.dirty
+        self.dirty = []
         if img is None:
             img = self.image
+        else:
+            # the panel will not show self.image any more
+            boxes = []
+            self.mark_dirty()
+
+        # not with the fallback below: it may not be the bare layer
+        data = None
+        if img is self.image:
+            data = self.layer_data(boxes)
+
+        if not boxes:
+            # drawn without mark_dirty()
+            boxes = [(0, 0, self.disp.width - 1, self.disp.height - 1)]
+
+        # the panel shows these pixels already: no bus transfer
+        changed = self.changed_boxes(img, boxes)
+        if len(changed) == 0:
+            self.skipped += 1
+            return True
+
+        if data is not None:
+            calls = [('display_data', data)]
+            calls += [('display', img) + tuple(box) for box in self.overlay]
+            sent = [(0, 0, self.disp.width - 1, self.disp.height - 1)]
+        else:
+            calls = [('display', img) + tuple(box) for box in changed]
+            sent = changed
+        self._log.debug('boxes = %s, native = %s', changed, data is not None)
+
+        for args in calls:
+            if not self._send(*args):
+                self.failed += 1
+                self._log.warning('frame dropped: %d', self.failed)
+                self.resync = True
+                return False
+
+        self.remember_shown(img, sent)
+        return True
+
+    def changed_boxes(self, img, boxes):
+        """
+        the parts of `boxes` where `img` differs from the frame on the
+        panel. Only the pixels in the boxes are compared.
+        """
+        if self.shown is None or self.shown.mode != img.mode:
+            return boxes
+
+        changed = []
+        for (x0, y0, x1, y1) in boxes:
+            region = (x0, y0, x1 + 1, y1 + 1)
+            bbox = ImageChops.difference(img.crop(region),
+                                         self.shown.crop(region)).getbbox()
+            if bbox is not None:
+                changed.append((x0 + bbox[0], y0 + bbox[1],
+                                x0 + bbox[2] - 1, y0 + bbox[3] - 1))
+        return changed
+
+    def remember_shown(self, img, boxes):
+        """
+        the panel shows the pixels of `boxes` of `img` now
+        """
+        if self.shown is None or self.shown.mode != img.mode:
+            self.shown = img.copy()
+            return
+
+        for (x0, y0, x1, y1) in boxes:
+            region = (x0, y0, x1 + 1, y1 + 1)
+            self.shown.paste(img.crop(region), region)
+
+    def _send(self, name, *args):
+        """
+        call self.disp.<name>(*args) with the retry policy.
+        The method is looked up on every try: reopen() replaces self.disp
+        """
+        for n in range(self.retry.max_retry + 1):
+            if n > 0:
+                time.sleep(self.retry.wait(n - 1))
 
-        while True:
             try:
-                self.disp.display(img)
-                break
+                getattr(self.disp, name)(*args)
             except Exception as e:
                 self._log.error('%s:%s', type(e).__name__, e)
-                time.sleep(0.1)
+                self.bus_errors += 1
+                self.err_seq += 1
+                if self.err_time is None:
+                    self.err_time = time.monotonic()
+                if self.err_seq % self.retry.reopen_after == 0:
+                    self.reopen()
+                continue
+
+            if self.err_time is not None:
+                sec = time.monotonic() - self.err_time
+                self._log.info('recovered: %.2f sec', sec)
+                self.recoveries += 1
+                self.recovery_sec += sec
+                self.err_time = None
+            self.err_seq = 0
+            return True
+
+        return False
+
+    def stats(self):
+        return {'bus_errors': self.bus_errors,
+                'reopens': self.reopens,
+                'recoveries': self.recoveries,
+                'recovery_sec': self.recovery_sec,
+                'failed': self.failed,
+                'skipped': self.skipped}
+
+    def scroll(self, top, rows, dy):
+        """
+        scroll the band of pixel rows [top, top + rows) of self.image
+        up by dy and blank the bottom dy rows.
+
+        When the controller can shift the band itself (hardware scroll),
+        only the blank rows are marked dirty, and the rows outside the
+        band if the controller moved them too (SCROLL_ALL of the driver).
+        Returns True when done in hardware.
+        """
+        (w, h) = self.image.size
+        band = self.image.crop((0, top + dy, w, top + rows))
+        self.image.paste(band, (0, top))
+        self.image.paste(0, (0, top + rows - dy, w, top + rows))
+
+        hw = False
+        if hasattr(self.disp, 'scroll'):
+            hw = self.disp.scroll(top, rows, dy)
+        self._log.debug('hw = %s', hw)
+
+        if not hw:
+            self.mark_dirty((0, top, w - 1, top + rows - 1))
+            return False
+
+        # the rows that wrapped around on the panel are not known
+        self.shown = None
+
+        # pending damage moved with the pixels
+        (boxes, self.dirty) = (self.dirty, [])
+        for (x0, y0, x1, y1) in boxes:
+            self.mark_dirty((x0, y0, x1, y1))
+            if y1 >= top and y0 < top + rows:
+                self.mark_dirty((x0, max(y0 - dy, top), x1, y1 - dy))
+        self.mark_dirty((0, top + rows - dy, w - 1, top + rows - 1))
+
+        if getattr(self.disp, 'SCROLL_ALL', False):
+            # the panel scrolled as a whole: put the rest back
+            self.mark_dirty((0, 0, w - 1, top - 1))
+            self.mark_dirty((0, top + rows, w - 1, h - 1))
+        return True
 
     def loadImagefile(self, imgfile, display_now=False, clear_flag=False):
         self._log.debug('imgfile = %s', imgfile)
@@ -193,10 +556,85 @@ SPI pins
         im2 = im.resize((w, h), Image.BICUBIC)
 
         self.image.paste(im2, (x, y))
+        self.mark_dirty((x, y, x + w - 1, y + h - 1))
         if display_now:
             self.display()
 
 
+class StaticLayer:
+    """
+    a still frame kept ready for the panel, see Lcd.show_layer()
+
+    image: copy in the canvas mode, restores what was drawn on top
+    data:  the whole frame in device-native bytes,
+           None if the driver has no display_data()
+    """
+    def __init__(self, ol, image, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+
+        self.image = image.copy()
+        if self.image.mode != ol.image.mode:
+            self.image = self.image.convert(ol.image.mode)
+
+        self.data = None
+        if hasattr(ol.disp, 'display_data'):
+            self.data = bytes(ol.disp.image_to_data(self.image))
+            self._log.debug('data: %d bytes', len(self.data))
+
+
+def box_area(box):
+    (x0, y0, x1, y1) = box
+    return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+
+def box_union(b1, b2):
+    return (min(b1[0], b2[0]), min(b1[1], b2[1]),
+            max(b1[2], b2[2]), max(b1[3], b2[3]))
+
+
+def box_touch(b1, b2):
+    """
+    overlapping or adjacent
+    """
+    return (b1[0] <= b2[2] + 1 and b2[0] <= b1[2] + 1 and
+            b1[1] <= b2[3] + 1 and b2[1] <= b1[3] + 1)
+
+
+def merge_box(boxes, box, max_boxes):
+    """
+    add `box` to `boxes` and return a new list of at most `max_boxes`
+    bounding boxes
+    """
+    rest = []
+    for b in boxes:
+        if box_touch(b, box):
+            box = box_union(b, box)
+        else:
+            rest.append(b)
+
+    if len(rest) < len(boxes):
+        # the grown box may touch others now
+        return merge_box(rest, box, max_boxes)
+
+    rest.append(box)
+
+    while len(rest) > max_boxes:
+        # merge the pair that wastes the fewest pixels
+        best = None
+        for i in range(len(rest)):
+            for j in range(i + 1, len(rest)):
+                u = box_union(rest[i], rest[j])
+                waste = box_area(u) - box_area(rest[i]) - box_area(rest[j])
+                if best is None or waste < best[0]:
+                    best = (waste, i, j, u)
+        (waste, i, j, u) = best
+        rest = [b for k, b in enumerate(rest) if k not in (i, j)]
+        rest = merge_box(rest, u, max_boxes)
+
+    return rest
+
+
 class BG:
     IMGFILE = ['rpilogo-2052x2581.png',
                'image-a.jpg',
@@ -222,22 +660,28 @@ class BG:
         for img in self.IMGFILE:
             self.ol.draw.rectangle(xy, outline=self.color, fill='black')
             self.ol.loadImagefile(img)
-            # self.bg_img.append(self.ol.image)
-            self.bg_img.append(copy.copy(self.ol.image))
+            for i in range(3):
+                xy = [(self.x1 + i, self.y1 + i), (self.x2 - i, self.y2 - i)]
+                self.ol.draw.rectangle(xy, outline=self.color, fill=None)
+            self.bg_img.append(StaticLayer(self.ol, self.ol.image,
+                                           debug=self._dbg))
 
         self.prev_sec = 0
         self.bg_idx = 0
 
     def draw(self):
+        """
+        switch the background every INTERVAL_SEC, otherwise erase only
+        what was drawn on it since the last call
+        """
         now_sec = time.time()
         if now_sec - self.prev_sec > self.INTERVAL_SEC:
             self.bg_idx = (self.bg_idx + 1) % len(self.IMGFILE)
             self.prev_sec = now_sec
-        self.ol.image.paste(self.bg_img[self.bg_idx], (0, 0))
+            self.ol.show_layer(self.bg_img[self.bg_idx])
+            return
 
-        for i in range(3):
-            xy = [(self.x1 + i, self.y1 + i), (self.x2 - i, self.y2 - i)]
-            self.ol.draw.rectangle(xy, outline=self.color, fill=None)
+        self.ol.restore_layer()
 
 
 class Ball:
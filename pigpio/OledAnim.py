@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+OledAnim.py
+
+Play GIF/APNG clips on the SPI panels (ST7789, SSD1331) from frames
+converted once into a device-native file.
+
+  convert: decode, fit and encode every frame with the driver's
+           image_to_data() (no hardware needed)
+  play:    mmap the file and write each frame with display_data(),
+           paced by a frame clock
+
+File layout (little endian):
+
+  header  HEADER_FMT  MAGIC, VERSION, width, height, frames, loop
+  index   INDEX_FMT   per frame: offset, length, duration [msec],
+                      window (x0, y0, x1, y1)
+  data    native bytes of each window
+
+Only the window that changed from the previous frame is kept.
+A frame identical to the previous one has no data and is skipped.
+The first frame is always whole.
+
+Usage:
+
+--
+$ ./OledAnim.py convert clip.gif clip.oanim st7789
+$ ./OledAnim.py play st7789 clip.oanim
+--
+"""
+__author__ = 'Yoichi Tanibayashi'
+__date__   = '2020'
+
+import mmap
+import time
+import struct
+import numpy as np
+import pigpio
+from PIL import Image, ImageSequence
+from FakePi import FakePi
+from SSD1331 import SSD1331
+from ST7789 import ST7789
+from Lcd import Lcd
+from MyLogger import get_logger
+import click
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+DRIVER = {'ssd1331': SSD1331, 'st7789': ST7789}
+
+MAGIC      = b'OANM'
+VERSION    = 1
+HEADER_FMT = '<4sHHHIH2x'
+INDEX_FMT  = '<QIH4H2x'
+
+DEF_DURATION = 100  # msec, when the clip does not tell
+
+
+def fit(img, size, resample=Image.BICUBIC):
+    """
+    shrink `img` to fit in `size` and center it on black
+    """
+    (w, h) = img.size
+    if w > size[0] or h > size[1]:
+        a = max(w / size[0], h / size[1])
+        (w, h) = (int(w / a), int(h / a))
+        img = img.resize((w, h), resample)
+
+    out = Image.new('RGB', size)
+    out.paste(img, ((size[0] - w) // 2, (size[1] - h) // 2))
+    return out
+
+
+def convert(src, dst, dev, resample=Image.BICUBIC, debug=False):
+    """
+    convert the clip `src` into the frame file `dst` for `dev`
+
+    Returns the number of frames
+    """
+    log = get_logger('convert', debug)
+
+    # the driver of `dev`, only for image_to_data()
+    disp = DRIVER[dev](FakePi(call_sec=0, xfer_sec=0))
+    (w, h) = disp.size
+
+    im = Image.open(src)
+    loop = im.info.get('loop', 0)
+
+    index = []
+    chunks = []
+    offset = (struct.calcsize(HEADER_FMT) +
+              struct.calcsize(INDEX_FMT) * getattr(im, 'n_frames', 1))
+
+    prev = None
+    for frame in ImageSequence.Iterator(im):
+        duration = int(frame.info.get('duration', DEF_DURATION)) or \
+            DEF_DURATION
+        img = fit(frame.convert('RGB'), (w, h), resample)
+        cur = np.frombuffer(disp.image_to_data(img), dtype='>u2'
+                            ).reshape(h, w)
+
+        if prev is None:
+            box = (0, 0, w - 1, h - 1)
+        else:
+            diff = cur != prev
+            ys = np.flatnonzero(diff.any(axis=1))
+            xs = np.flatnonzero(diff.any(axis=0))
+            box = None
+            if len(ys) > 0:
+                box = (int(xs[0]), int(ys[0]), int(xs[-1]), int(ys[-1]))
+        prev = cur
+
+        if box is None:
+            index.append((offset, 0, duration, 0, 0, 0, 0))
+            continue
+
+        (x0, y0, x1, y1) = box
+        data = cur[y0:y1 + 1, x0:x1 + 1].tobytes()
+        index.append((offset, len(data), duration) + box)
+        chunks.append(data)
+        offset += len(data)
+        log.debug('%d: %s %d bytes', len(index) - 1, box, len(data))
+
+    with open(dst, 'wb') as f:
+        f.write(struct.pack(HEADER_FMT, MAGIC, VERSION, w, h, len(index),
+                            loop))
+        for entry in index:
+            f.write(struct.pack(INDEX_FMT, *entry))
+        for data in chunks:
+            f.write(data)
+
+    log.info('%s: %d frames, %d bytes', dst, len(index), offset)
+    return len(index)
+
+
+class AnimPlayer:
+    def __init__(self, lcd, path, debug=False):
+        """
+        lcd: Lcd
+        """
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+        self._log.debug('path = %s', path)
+
+        self.lcd  = lcd
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(self.mm)
+
+        (magic, ver, w, h, frames, loop) = struct.unpack_from(HEADER_FMT,
+                                                              self.buf, 0)
+        if magic != MAGIC or ver != VERSION:
+            self.close()
+            self._log.error('%s: not a frame file', path)
+            raise RuntimeError('%s: not a frame file' % path)
+        if (w, h) != self.lcd.disp.size:
+            self.close()
+            self._log.error('%s: %dx%d: not for this display', path, w, h)
+            raise RuntimeError('%s: size mismatch' % path)
+        self.loop = loop
+
+        offset = struct.calcsize(HEADER_FMT)
+        size = struct.calcsize(INDEX_FMT)
+        self.index = [struct.unpack_from(INDEX_FMT, self.buf,
+                                         offset + i * size)
+                      for i in range(frames)]
+        self._log.debug('frames=%d, loop=%d', frames, loop)
+
+        self.shown   = 0
+        self.skipped = 0
+        self.late    = 0
+        self.failed  = 0
+
+    def close(self):
+        self._log.debug('')
+        self.buf.release()
+        self.mm.close()
+
+    def play(self, loops=None, speed=1.0):
+        """
+        loops: None .. as the clip says, 0: forever
+        """
+        if loops is None:
+            loops = self.loop
+        self._log.debug('loops=%d, speed=%s', loops, speed)
+
+        n = 0
+        next_sec = time.monotonic()
+        while loops == 0 or n < loops:
+            n += 1
+            for (offset, length, duration, x0, y0, x1, y1) in self.index:
+                if length == 0:
+                    self.skipped += 1
+                else:
+                    data = self.buf[offset:offset + length]
+                    if not self.lcd._send('display_data', data,
+                                          x0, y0, x1, y1):
+                        # the next frames are deltas of this one:
+                        # start again from the whole first frame
+                        self.failed += 1
+                        self._log.warning('frame dropped: %d', self.failed)
+                        break
+                    self.shown += 1
+
+                next_sec += duration / 1000 / speed
+                sleep_sec = next_sec - time.monotonic()
+                if sleep_sec > 0:
+                    time.sleep(sleep_sec)
+                else:
+                    self.late += 1
+                    next_sec = time.monotonic()
+
+        # the canvas of lcd is not on the panel any more
+        self.lcd.resync = True
+
+    def stats(self):
+        return {'shown': self.shown, 'skipped': self.skipped,
+                'late': self.late, 'failed': self.failed}
+
+
+@click.group(context_settings=CONTEXT_SETTINGS)
+def cli():
+    pass
+
+
+@cli.command('convert', help='convert a GIF/APNG clip into a frame file')
+@click.argument('src', type=click.Path(exists=True), nargs=1)
+@click.argument('dst', type=click.Path(), nargs=1)
+@click.argument('dev', type=click.Choice(DRIVER.keys()), nargs=1)
+@click.option('--debug', '-d', 'debug', is_flag=True, default=False,
+              help='debug flag')
+def convert_cmd(src, dst, dev, debug):
+    convert(src, dst, dev, debug=debug)
+
+
+@cli.command('play', help='play a frame file')
+@click.argument('dev', type=click.Choice(DRIVER.keys()), nargs=1)
+@click.argument('path', type=click.Path(exists=True), nargs=1)
+@click.option('--loops', '-l', 'loops', type=int, default=None,
+              help='0: forever, default: as the clip says')
+@click.option('--speed', '-s', 'speed', type=float, default=1.0,
+              help='playback speed')
+@click.option('--fake', '-f', 'fake', is_flag=True, default=False,
+              help='use stand-in pigpio (no hardware)')
+@click.option('--debug', '-d', 'debug', is_flag=True, default=False,
+              help='debug flag')
+def play_cmd(dev, path, loops, speed, fake, debug):
+    logger = get_logger('', debug)
+    logger.debug('dev  = %s', dev)
+    logger.debug('path = %s', path)
+
+    if fake:
+        pi = FakePi()
+    else:
+        pi = pigpio.pi()
+
+    lcd = Lcd(pi, dev, debug=debug)
+    player = AnimPlayer(lcd, path, debug=debug)
+    try:
+        player.play(loops, speed)
+    finally:
+        logger.info('stats: %s', player.stats())
+        player.close()
+        lcd.cleanup()
+        pi.stop()
+
+
+if __name__ == '__main__':
+    cli()
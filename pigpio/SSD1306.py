@@ -3,6 +3,7 @@
 #
 import pigpio
 import _LCD_I2C
+import numpy as np
 from PIL import Image
 from PIL import ImageDraw
 import time
@@ -52,32 +53,52 @@ HEIGHT     = 64
 COLOR_MODE = '1'
 I2C_ADDR   = '0x3c'
 
+BLOCK_SIZE = 1024  # bytes per I2C transfer: whole frame
+
 
 class SSD1306(_LCD_I2C._LCD_I2C):
     _log = get_logger(__name__, False)
 
-    def __init__(self, pi, i2c_bus, i2c_addr=I2C_ADDR, debug=False):
+    RUN_GAP = 8  # bridge unchanged columns rather than open a new window
+    SCROLL_ALL = True  # scroll() moves every row, see Lcd.scroll()
+
+    def __init__(self, pi, i2c_bus, i2c_addr=I2C_ADDR, block_size=BLOCK_SIZE,
+                 rotate=0, debug=False):
+        """
+        block_size: bytes per I2C transfer, <= 32: SMBus block writes
+        rotate:     0 or 2 (180 degrees, by SEGREMAP and COM scan)
+        """
         self._dbg = debug
         __class__._log = get_logger(__class__.__name__, self._dbg)
         self._log.debug('i2c_bus=%s, i2c_addr=%s', i2c_bus, i2c_addr)
+        self._log.debug('block_size=%s', block_size)
 
-        self.pi       = pi
-        self.i2c_bus  = i2c_bus
-        self.i2c_addr = i2c_addr
+        self.pi         = pi
+        self.i2c_bus    = i2c_bus
+        self.i2c_addr   = i2c_addr
+        self.block_size = block_size
+
+        if rotate not in (0, 2):
+            # 90 degrees needs the pixels transposed into pages
+            raise RuntimeError('invalid rotate: %s' % rotate)
+        self.rotate     = rotate
 
         self.width      = WIDTH
         self.height     = HEIGHT
         self.size       = (self.width, self.height)
         self.pages      = self.height//8
-        self.mask       = [1 << (i // self.width) % 8
-                           for i in range(self.width * self.height)]
-        self.offsets    = [(self.width * (i // (self.width * 8)))
-                           for i in range(self.width * self.height)]
         self.color_mode = COLOR_MODE
 
+        # page buffer as the controller holds it, None: unknown
+        self.sent       = None
+        # hardware scroll offset (rows), see scroll()
+        self.vscroll    = 0
+
         super().__init__(self.pi, self.color_mode, self.i2c_bus, self.i2c_addr)
 
     def reset(self):
+        self.sent = None
+        self.vscroll = 0
         return
 
     def _init(self):
@@ -98,9 +119,12 @@ class SSD1306(_LCD_I2C._LCD_I2C):
         self.data(MEMORYMODE)
         self.data(0x00)
 
-        self.command(SEGREMAP | 0x01)
-
-        self.command(COMSCANDEC)
+        if self.rotate == 2:
+            self.command(SEGREMAP)
+            self.command(COMSCANINC)
+        else:
+            self.command(SEGREMAP | 0x01)
+            self.command(COMSCANDEC)
 
         self.data(SETCOMPINS)
         self.data(0x12)
@@ -121,37 +145,118 @@ class SSD1306(_LCD_I2C._LCD_I2C):
         self.command(NORMALDISPLAY)
 
     def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        """
+        y0, y1: page
+        """
         if x1 is None:
             x1 = self.width-1
         if y1 is None:
-            y1 = self.height-1
-
-        self.data(COLUMNADDR)
-        self.data(x0)
-        self.data(x1)
-
-        self.data(PAGEADDR)
-        self.data(y0)
-        self.data(y1)
+            y1 = self.pages-1
+
+        self.command(COLUMNADDR, x0, x1)
+        self.command(PAGEADDR, y0, y1)
+
+    def pack(self, image):
+        """
+        image -> page ordered array: buf[page, x]
+        bit n of buf[page, x] is the pixel (x, page * 8 + n)
+        """
+        if image.mode != '1':
+            image = image.convert('1')
+        pix = np.asarray(image, dtype=np.uint8)
+        if self.vscroll != 0:
+            # logical rows -> RAM rows
+            pix = np.roll(pix, self.vscroll, axis=0)
+        pix = pix.reshape(self.pages, 8, self.width).transpose(0, 2, 1)
+        return np.packbits(pix, axis=2, bitorder='little').reshape(
+            self.pages, self.width)
+
+    def image_to_data(self, image):
+        return self.pack(image).tobytes()
 
     def display(self, image=None, x0=0, y0=0, x1=None, y1=None):
+        """
+        (x0, y0), (x1, y1): pixel, rows are rounded out to whole pages
+        """
         self._log.debug('(x0,y0)=(%s,%s), (x1,y1)=(%s,%s)',
                         x0, y0, x1, y1)
         if image is None:
             image = self.buffer
+        if x1 is None:
+            x1 = self.width-1
+        if y1 is None:
+            y1 = self.height-1
 
-        self.set_window(x0, y0, x1, y1)
-
-        buf = bytearray(self.width * self.pages)
-        idx = 0
-        for pix in image.getdata():
-            if pix > 0:
-                buf[self.offsets[idx]] |= self.mask[idx]
-            idx += 1
-
-        for i in range(0, len(buf), 16):
-            self._log.debug('i=%s', i)
-            self.data(self.i2c, buf[i:i+16])
+        (p0, p1) = (y0 // 8, y1 // 8)
+        if self.vscroll != 0:
+            (p0, p1) = (0, self.pages - 1)
+        buf = self.pack(image)
+
+        if self.sent is None:
+            # the controller RAM is unknown: send the whole frame once
+            runs = [(0, self.pages - 1, 0, self.width - 1)]
+        else:
+            runs = self.changed_runs(buf, p0, p1, x0, x1)
+        self._log.debug('runs=%s', runs)
+
+        try:
+            for (pa, pb, xa, xb) in runs:
+                self.set_window(xa, pa, xb, pb)
+                out = buf[pa:pb + 1, xa:xb + 1].tobytes()
+                self.data_block(out, self.block_size)
+        except Exception:
+            # the controller RAM is unknown now
+            self.sent = None
+            raise
+
+        if self.sent is None:
+            self.sent = buf
+            return
+        for (pa, pb, xa, xb) in runs:
+            self.sent[pa:pb + 1, xa:xb + 1] = buf[pa:pb + 1, xa:xb + 1]
+
+    def scroll(self, top, rows, dy):
+        """
+        scroll rows [top, top + rows) up by dy with SETSTARTLINE.
+        The RAM is not touched: display() maps the logical rows.
+
+        The start line moves the whole panel (SCROLL_ALL): the rows
+        outside [top, top + rows) move too and have to be displayed
+        again. The RAM under them is kept in self.sent, so that costs
+        only the pages that really differ.
+
+        Not rotated. Returns False when not done.
+        """
+        if self.rotate != 0:
+            return False
+        if self.sent is None:
+            return False
+
+        self.vscroll = (self.vscroll + dy) % self.height
+        self._log.debug('vscroll=%d', self.vscroll)
+        self.command(SETSTARTLINE | self.vscroll)
+        return True
+
+    def changed_runs(self, buf, p0, p1, x0, x1):
+        """
+        column runs of `buf` that differ from the last sent buffer
+        in the window: [(page, page, xa, xb), ..]
+        """
+        runs = []
+        diff = (buf[p0:p1 + 1, x0:x1 + 1] !=
+                self.sent[p0:p1 + 1, x0:x1 + 1])
+        for p in range(p0, p1 + 1):
+            cols = np.flatnonzero(diff[p - p0])
+            if len(cols) == 0:
+                continue
+
+            brk = np.flatnonzero(np.diff(cols) > self.RUN_GAP)
+            starts = cols[np.r_[0, brk + 1]]
+            ends = cols[np.r_[brk, len(cols) - 1]]
+            for (xa, xb) in zip(starts, ends):
+                runs.append((p, p, x0 + int(xa), x0 + int(xb)))
+
+        return runs
 
     def clear(self):
         width, height = self.buffer.size
@@ -56,29 +56,43 @@ WHITE       = 0xFFFF # 0b 11111 111111 11111
 
 COLOR_MODE = 'RGB'
 
+# rotate (x 90 degrees clockwise) -> remap and color depth (0xA0)
+#   base 0x72 (0x60 + column remap + COM scan remap), 65k color
+#   bit0: vertical address increment .. transpose
+#   bit1: column remap, bit4: COM scan remap .. flip
+# 90 and 270 degrees: transpose and exactly one flip
+ROTATE = {0: 0x72, 1: 0x71, 2: 0x60, 3: 0x63}
+
 class SSD1331(_LCD_SPI):
     """Representation of an ST7789 IPS LCD."""
 
-    def __init__(self, pi, spi_mode=3, spi_rst=25, spi_dc=24, led=0):
+    def __init__(self, pi, spi_mode=3, spi_rst=25, spi_dc=24, led=0,
+                 rotate=0):
         self.pi       = pi
-        self.spi_mode = mode
-        self.spi_rst  = rst
-        self.spi_dc   = dc
+        self.spi_mode = spi_mode
+        self.spi_rst  = spi_rst
+        self.spi_dc   = spi_dc
         self.led      = led
 
+        if rotate not in ROTATE:
+            raise RuntimeError('invalid rotate: %s' % rotate)
+        self.rotate   = rotate
+
         self.width      = WIDTH
         self.height     = HEIGHT
+        if rotate % 2 == 1:
+            (self.width, self.height) = (HEIGHT, WIDTH)
         self.size       = (self.width, self.height)
         self.color_mode = COLOR_MODE
         
-        self.pi.set_mode(self.dc, pigpio.OUTPUT)
+        self.pi.set_mode(self.spi_dc, pigpio.OUTPUT)
 
         super().__init__(self.pi, self.color_mode,
                          0, SPI_CLOCK_HZ, self.spi_mode,
                          self.spi_rst, self.spi_dc)
 
     def reset(self):
-        if self.rst is not None:
+        if self.spi_rst is not None:
             self.pi.write(self.spi_rst, 1)
             time.sleep(0.100)
             self.pi.write(self.spi_rst, 0)
@@ -89,7 +103,7 @@ class SSD1331(_LCD_SPI):
     def _init(self):
         time.sleep(0.010)
         self.command(0xAE)  # Display Off
-        self.command([0xA0, 0x72])  # Seg remoap
+        self.command([0xA0, ROTATE[self.rotate]])  # Seg remoap
         self.command([0xA1, 0x00])  #  Set Display start line
         self.command([0xA2, 0x00])  # Set display Offset
         self.command(0xA4)  # Normal display
@@ -111,6 +125,10 @@ class SSD1331(_LCD_SPI):
             x1 = self.width-1
         if y1 is None:
             y1 = self.height-1
+        if self.rotate % 2 == 1:
+            # vertical address increment: the data fills a RAM column
+            # first, so x of the image runs along the RAM rows
+            (x0, y0, x1, y1) = (y0, x0, y1, x1)
         self.command([0x15, x0, x1])       # Column addr set
         self.command([0x75, y0, y1])       # Row addr set
 
@@ -128,10 +146,20 @@ class SSD1331(_LCD_SPI):
         if y1 is None:
             y1 = self.height-1
         self.set_window(x0, y0, x1, y1)
+        if (x0, y0, x1, y1) != (0, 0, self.width-1, self.height-1):
+            image = image.crop((x0, y0, x1+1, y1+1))
 
-        pixelbytes = list(self.image_to_data(image))
+        pixelbytes = self.image_to_data(image)
         self.data(pixelbytes)
 
+    def display_data(self, data, x0=0, y0=0, x1=None, y1=None):
+        """
+        write image_to_data() bytes of the window as they are
+        (default: the whole frame)
+        """
+        self.set_window(x0, y0, x1, y1)
+        self.data(data)
+
     def clear(self, color=(0,0,0)):
         width, height = self.buffer.size
         self.buffer.putdata([color]*(width*height))
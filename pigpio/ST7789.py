@@ -10,6 +10,7 @@ SPI_CLOCK_HZ = 40000000 # 40 MHz
 # Constants for interacting with display registers.
 WIDTH    = 240
 HEIGHT   = 240
+RAM_HEIGHT = 320
 
 NOP         = 0x00
 SWRESET     = 0x01 # Sofware Reset
@@ -120,20 +121,36 @@ WHITE       = 0xFFFF # 0b 11111 111111 11111
 
 COLOR_MODE = 'RGB'
 
+# rotate (x 90 degrees clockwise) -> (MADCTL, x offset, y offset)
+# the RAM is 240x320: mirrored rows start at 80
+ROTATE = {0: (0x00, 0, 0),
+          1: (0x60, 0, 0),
+          2: (0xC0, 0, 80),
+          3: (0xA0, 80, 0)}
+
 class ST7789(_LCD_SPI._LCD_SPI):
 
-    def __init__(self, pi, spi_mode=3, spi_rst=25, spi_dc=24, led=8):
+    def __init__(self, pi, spi_mode=3, spi_rst=25, spi_dc=24, led=8,
+                 rotate=0):
         self.pi       = pi
         self.spi_mode = spi_mode
         self.spi_rst  = spi_rst
         self.spi_dc   = spi_dc
         self.led      = led
 
+        if rotate not in ROTATE:
+            raise RuntimeError('invalid rotate: %s' % rotate)
+        self.rotate   = rotate
+        (self.madctl, self.x_off, self.y_off) = ROTATE[rotate]
+
         self.width      = WIDTH
         self.height     = HEIGHT
         self.size       = (self.width, self.height)
         self.color_mode = COLOR_MODE
 
+        # hardware scroll: (top, rows, offset) or None
+        self.vscroll    = None
+
         self.pi.set_mode(self.spi_dc, pigpio.OUTPUT)
 
         super().__init__(self.pi, self.color_mode,
@@ -141,6 +158,7 @@ class ST7789(_LCD_SPI._LCD_SPI):
                          self.spi_rst, self.spi_dc)
 
     def reset(self):
+        self.vscroll = None
         if self.spi_rst is not None:
             self.pi.write(self.spi_rst, 1)
             time.sleep(0.100)
@@ -154,7 +172,7 @@ class ST7789(_LCD_SPI._LCD_SPI):
         time.sleep(0.150)
 
         self.command(MADCTL)
-        self.data(0x00)
+        self.data(self.madctl)
 
         self.command(COLMOD)
         self.data(0x05)
@@ -236,6 +254,8 @@ class ST7789(_LCD_SPI._LCD_SPI):
             x1 = self.width-1
         if y1 is None:
             y1 = self.height-1
+        (x0, x1) = (x0 + self.x_off, x1 + self.x_off)
+        (y0, y1) = (y0 + self.y_off, y1 + self.y_off)
         self.command(CASET)       # Column addr set
         self.data(x0 >> 8)
         self.data(x0)                    # XSTART
@@ -264,14 +284,85 @@ class ST7789(_LCD_SPI._LCD_SPI):
             x1 = self.width-1
         if y1 is None:
             y1 = self.height-1
-        self.set_window(x0, y0, x1, y1)
-        # Convert image to array of 16bit 565 RGB data bytes.
-        # Unfortunate that this copy has to occur, but the SPI byte writing
-        # function needs to take an array of bytes and PIL doesn't natively
-        # store images in 16-bit 565 RGB format.
-        pixelbytes = list(self.image_to_data(image))
-        # Write data to hardware.
-        self.data(pixelbytes)
+        for (ly0, ly1, ry0) in self.ram_spans(y0, y1):
+            self.set_window(x0, ry0, x1, ry0 + ly1 - ly0)
+            if (x0, ly0, x1, ly1) != (0, 0, self.width-1, self.height-1):
+                data = self.image_to_data(image.crop((x0, ly0, x1+1, ly1+1)))
+            else:
+                # Convert image to array of 16bit 565 RGB data bytes.
+                data = self.image_to_data(image)
+            # Write data to hardware.
+            self.data(data)
+
+    def display_data(self, data, x0=0, y0=0, x1=None, y1=None):
+        """
+        write image_to_data() bytes of the window as they are
+        (default: the whole frame)
+        """
+        if x1 is None:
+            x1 = self.width-1
+        if y1 is None:
+            y1 = self.height-1
+        rowbytes = (x1 - x0 + 1) * 2
+        for (ly0, ly1, ry0) in self.ram_spans(y0, y1):
+            self.set_window(x0, ry0, x1, ry0 + ly1 - ly0)
+            self.data(data[(ly0 - y0) * rowbytes:(ly1 - y0 + 1) * rowbytes])
+
+    def ram_spans(self, y0, y1):
+        """
+        logical rows [y0, y1] -> [(ly0, ly1, RAM row of ly0), ..]
+        split where the hardware scroll area wraps
+        """
+        if self.vscroll is None:
+            return [(y0, y1, y0)]
+
+        (top, rows, off) = self.vscroll
+        bottom = top + rows - 1
+        wrap = top + rows - off	# first logical row stored at RAM `top`
+
+        spans = []
+        for (a, b) in [(y0, min(y1, top - 1)),
+                       (max(y0, top), min(y1, wrap - 1)),
+                       (max(y0, wrap), min(y1, bottom)),
+                       (max(y0, bottom + 1), y1)]:
+            if a > b:
+                continue
+            if top <= a <= bottom:
+                spans.append((a, b, top + (a - top + off) % rows))
+            else:
+                spans.append((a, b, a))
+        return spans
+
+    def scroll(self, top, rows, dy):
+        """
+        scroll rows [top, top + rows) up by dy with VSCRDEF/VSCRSADD.
+        The RAM is not touched: display() maps the logical rows.
+
+        Only one scroll area at a time, not rotated.
+        Returns False when not done.
+        """
+        if self.rotate != 0:
+            return False
+
+        if self.vscroll is not None and self.vscroll[:2] != (top, rows):
+            if self.vscroll[2] != 0:
+                return False
+            self.vscroll = None
+
+        if self.vscroll is None:
+            self.command(VSCRDEF)
+            for v in (top, rows, RAM_HEIGHT - top - rows):
+                self.data(v >> 8)
+                self.data(v & 0xFF)
+            self.vscroll = (top, rows, 0)
+
+        off = (self.vscroll[2] + dy) % rows
+        self.vscroll = (top, rows, off)
+
+        self.command(VSCRSADD)
+        self.data((top + off) >> 8)
+        self.data((top + off) & 0xFF)
+        return True
 
     def clear(self, color=(0,0,0)):
         """Clear the image buffer to the specified RGB color (default black)."""
@@ -19,14 +19,18 @@ class _LCD:
 
     def image_to_data(self, image):
         """
-        Generator function to convert a PIL image to 16-bit 565 RGB bytes.
+        Convert a PIL image to 16-bit 565 RGB bytes (big endian).
+        Returns a byte memoryview over one NumPy buffer.
         """
-        # NumPy is much faster at doing this. NumPy code provided by:
-        # Keith (https://www.blogger.com/profile/02555547344016007163)
-        pb = np.array(image.convert(self.color_mode)).astype('uint16')
-        print('pb=%s' % pb[0])
-        color = ((pb[:,:,0] & 0xF8) << 8) | ((pb[:,:,1] & 0xFC) << 3) | (pb[:,:,2] >> 3)
-        return np.dstack(((color >> 8) & 0xFF, color & 0xFF)).flatten().tolist()
+        if image.mode != self.color_mode:
+            image = image.convert(self.color_mode)
+        pb = np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(-1, 3)
+
+        color = (pb[:, 0] & 0xF8).astype('>u2')
+        color <<= 8
+        color |= (pb[:, 1] & 0xFC).astype('>u2') << 3
+        color |= pb[:, 2] >> 3
+        return memoryview(color.view(np.uint8))
 
     def reset(self):
         pass
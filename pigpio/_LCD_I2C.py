@@ -25,6 +25,21 @@ class _LCD_I2C(_LCD._LCD):
     def data(self, *val):
         self.pi.i2c_write_i2c_block_data(self.i2c, MODE_DATA, list(val))
 
+    def data_block(self, buf, block_size=32):
+        """
+        write a buffer of display data `block_size` bytes at a time.
+
+        block_size > 32: raw i2c_write_device() transfers
+                         (control byte + data, one start/stop each)
+        else:            SMBus block writes
+        """
+        for i in range(0, len(buf), block_size):
+            chunk = bytes(buf[i:i + block_size])
+            if block_size > 32:
+                self.pi.i2c_write_device(self.i2c, bytes([MODE_DATA]) + chunk)
+            else:
+                self.pi.i2c_write_i2c_block_data(self.i2c, MODE_DATA, chunk)
+
     def cleanup(self):
         print('%s.cleanup()' % __class__.__name__)
         super().cleanup()
@@ -2,6 +2,40 @@
 import pigpio
 import _LCD
 import numbers
+import os
+import json
+import time
+
+CHUNK_SIZE  = 4096
+CHUNK_SIZES = [512, 1024, 2048, 4096, 8192, 16384, 32768, 65536]
+CHUNK_FILE  = os.path.expanduser('~/.config/OledServer/spi_chunk.json')
+
+
+def load_chunk_size(name, default=CHUNK_SIZE, path=CHUNK_FILE):
+    """
+    calibrated chunk size of the driver `name`
+    """
+    try:
+        with open(path) as f:
+            return int(json.load(f)[name]['chunk_size'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return default
+
+
+def save_chunk_size(name, chunk_size, bytes_per_sec, path=CHUNK_FILE):
+    try:
+        with open(path) as f:
+            conf = json.load(f)
+    except (OSError, ValueError):
+        conf = {}
+
+    conf[name] = {'chunk_size': chunk_size,
+                  'bytes_per_sec': int(bytes_per_sec)}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(conf, f, indent=2, sort_keys=True)
+
 
 class _LCD_SPI(_LCD._LCD):
     def __init__(self, pi, color_mode,
@@ -16,19 +50,62 @@ class _LCD_SPI(_LCD._LCD):
         
         self.spi = self.pi.spi_open(self.spi_ch, self.spi_baud, self.spi_flags)
 
+        # see calibrate()
+        self.chunk_size = load_chunk_size(self.__class__.__name__)
+
         super().__init__(self.pi, self.color_mode)
 
-    def send(self, data, is_data=True, chunk_size=4096):
+    def send(self, data, is_data=True, chunk_size=None):
+        """
+        data: a number, a list of numbers or any buffer-protocol object
+        (bytes, bytearray, memoryview, numpy array)
+        """
+        if chunk_size is None:
+            chunk_size = self.chunk_size
         # Set DC low for command, high for data.
         self.pi.write(self.spi_dc, is_data)
         # Convert scalar argument to list so either can be passed as parameter.
         if isinstance(data, numbers.Number):
             data = [data & 0xFF]
+        # Slice buffers without copying.
+        if not isinstance(data, list):
+            data = memoryview(data).cast('B')
         # Write data a chunk at a time.
         for start in range(0, len(data), chunk_size):
             end = min(start+chunk_size, len(data))
             self.pi.spi_write(self.spi, data[start:end])
 
+    def calibrate(self, sizes=CHUNK_SIZES, nbytes=None, repeat=3, save=True):
+        """
+        measure the throughput of spi_write() for each chunk size,
+        keep (and save) the best one.
+        The display RAM is overwritten with black.
+
+        Returns (best chunk size, {chunk size: bytes per second})
+        """
+        if nbytes is None:
+            nbytes = self.width * self.height * 2
+        buf = bytes(nbytes)
+
+        bps = {}
+        for chunk_size in sizes:
+            sec = None
+            for i in range(repeat):
+                self.set_window()
+                t0 = time.perf_counter()
+                self.send(buf, True, chunk_size)
+                t = time.perf_counter() - t0
+                if sec is None or t < sec:
+                    sec = t
+            bps[chunk_size] = nbytes / sec
+
+        best = max(bps, key=bps.get)
+        self.chunk_size = best
+        if save:
+            save_chunk_size(self.__class__.__name__, best, bps[best])
+
+        return (best, bps)
+
     def command(self, data):
         """Write a byte or array of bytes to the display as command data."""
         self.send(data, False)
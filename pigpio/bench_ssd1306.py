@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+SSD1306 I2C transfer benchmark: frames per second against block size
+"""
+import pigpio
+import time
+from FakePi import FakePi
+from SSD1306 import SSD1306
+from PIL import Image, ImageDraw
+from MyLogger import get_logger
+import click
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+BLOCK_SIZES = [16, 32, 64, 128, 256, 512, 1024]
+
+
+class BenchSSD1306:
+    def __init__(self, pi, i2c_bus=1, i2c_addr=0x3C, debug=False):
+        self._dbg = debug
+        self._log = get_logger(__class__.__name__, self._dbg)
+
+        self.pi       = pi
+        self.i2c_bus  = i2c_bus
+        self.i2c_addr = i2c_addr
+
+    def run(self, block_size, frames=20):
+        """
+        send `frames` whole frames, return frames per second
+        """
+        disp = SSD1306(self.pi, self.i2c_bus, self.i2c_addr,
+                       block_size=block_size, debug=self._dbg)
+        disp.begin()
+
+        img = Image.new(disp.color_mode, disp.size)
+        draw = ImageDraw.Draw(img)
+
+        t0 = time.perf_counter()
+        for i in range(frames):
+            draw.rectangle([(0, 0), (disp.width - 1, disp.height - 1)],
+                           fill=i % 2)
+            disp.sent = None	# no change detection: whole frame
+            disp.display(img)
+        sec = time.perf_counter() - t0
+
+        self.pi.i2c_close(disp.i2c)
+
+        fps = frames / sec
+        self._log.debug('block_size=%d: %.1f fps', block_size, fps)
+        return fps
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--fake', '-f', 'fake', is_flag=True, default=False,
+              help='use stand-in pigpio (no hardware)')
+@click.option('--frames', '-n', 'frames', type=int, default=20,
+              help='frames per block size')
+@click.option('--block', '-b', 'block', type=int, multiple=True,
+              help='block size (repeatable)')
+@click.option('--debug', '-d', 'debug', is_flag=True, default=False,
+              help='debug flag')
+def main(fake, frames, block, debug):
+    logger = get_logger('', debug)
+    logger.debug('fake   = %s', fake)
+    logger.debug('frames = %d', frames)
+
+    if fake:
+        pi = FakePi()
+    else:
+        pi = pigpio.pi()
+
+    bench = BenchSSD1306(pi, debug=debug)
+    try:
+        print('block_size      fps')
+        for bs in (block or BLOCK_SIZES):
+            print('%10d %8.1f' % (bs, bench.run(bs, frames)))
+    finally:
+        pi.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+calibrate the SPI chunk size of a display driver and save it
+for the driver (see _LCD_SPI.calibrate())
+"""
+import pigpio
+from FakePi import FakePi
+from SSD1331 import SSD1331
+from ST7789 import ST7789
+import _LCD_SPI
+from MyLogger import get_logger
+import click
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+DRIVER = {'ssd1331': SSD1331, 'st7789': ST7789}
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('dev', type=click.Choice(DRIVER.keys()), nargs=1)
+@click.option('--fake', '-f', 'fake', is_flag=True, default=False,
+              help='use stand-in pigpio (no hardware)')
+@click.option('--repeat', '-r', 'repeat', type=int, default=3,
+              help='measurements per chunk size')
+@click.option('--dry-run', '-n', 'dry_run', is_flag=True, default=False,
+              help='do not save the result')
+@click.option('--debug', '-d', 'debug', is_flag=True, default=False,
+              help='debug flag')
+def main(dev, fake, repeat, dry_run, debug):
+    logger = get_logger('', debug)
+    logger.debug('dev  = %s', dev)
+    logger.debug('fake = %s', fake)
+
+    if fake:
+        pi = FakePi()
+    else:
+        pi = pigpio.pi()
+
+    try:
+        disp = DRIVER[dev](pi)
+        disp.begin()
+
+        (best, bps) = disp.calibrate(repeat=repeat, save=not dry_run)
+        print('chunk_size  bytes/sec')
+        for chunk_size in sorted(bps):
+            print('%10d %10d%s' % (chunk_size, bps[chunk_size],
+                                   ' *' if chunk_size == best else ''))
+        if not dry_run:
+            print('saved: %s' % _LCD_SPI.CHUNK_FILE)
+    finally:
+        pi.stop()
+
+
+if __name__ == '__main__':
+    main()
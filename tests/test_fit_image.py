@@ -0,0 +1,62 @@
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+Oled.fit_image() without a device
+
+$ python3 -m pytest tests
+"""
+import os
+import sys
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+pytest.importorskip('RPi.GPIO')
+pytest.importorskip('luma.oled.device')
+
+from Oled import Oled               # noqa: E402
+from MyLogger import get_logger     # noqa: E402
+
+
+@pytest.fixture
+def ol():
+    # only what fit_image() needs: no interface is opened
+    ol = Oled.__new__(Oled)
+    ol._log = get_logger('Oled', False)
+    ol.mode = '1'
+    ol.max_src_pixels = Oled.MAX_SRC_PIXELS
+    return ol
+
+
+@pytest.mark.parametrize('src_size, fitted', [
+    ((3000, 10), (96, 1)),
+    ((10, 3000), (1, 64)),
+    ((960, 640), (96, 64)),
+    ((40, 30), (40, 30)),
+])
+def test_fit_image_size(ol, tmp_path, src_size, fitted):
+    path = str(tmp_path / 'src.png')
+    Image.new('RGB', src_size, 'white').save(path)
+
+    im = ol.fit_image(path, (96, 64))
+
+    assert im.size == fitted
+    assert im.mode == '1'
+
+
+@pytest.mark.parametrize('src_mode', ['P', '1', 'I;16', 'L', 'RGBA'])
+@pytest.mark.parametrize('canvas_mode', ['1', 'RGB'])
+def test_fit_image_mode(ol, tmp_path, src_mode, canvas_mode):
+    # more than twice the display: shrunk by reduce() first
+    path = str(tmp_path / 'src.png')
+    src = Image.new('RGB', (1000, 700), 'white').convert(src_mode)
+    src.save(path)
+    assert Image.open(path).mode == src_mode
+
+    ol.mode = canvas_mode
+    im = ol.fit_image(path, (96, 64))
+
+    assert im.size == (91, 64)
+    assert im.mode == canvas_mode
@@ -0,0 +1,54 @@
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+Lcd.scroll() of a band with the SSD1306 start line
+
+$ python3 -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pigpio'))
+
+pytest.importorskip('pigpio')
+
+from FakePi import FakePi           # noqa: E402
+from Lcd import Lcd                 # noqa: E402
+
+
+def panel(disp):
+    """
+    what the panel shows: the RAM (disp.sent) from the start line on
+    """
+    bits = np.unpackbits(disp.sent[:, :, np.newaxis], axis=2,
+                         bitorder='little')
+    ram = bits.transpose(0, 2, 1).reshape(disp.height, disp.width)
+    return np.roll(ram, -disp.vscroll, axis=0)
+
+
+@pytest.mark.parametrize('top, rows', [(0, 64), (0, 56), (8, 48), (1, 63)])
+def test_scroll_band(top, rows):
+    pi = FakePi(call_sec=0, xfer_sec=0)
+    lcd = Lcd(pi, 'ssd1306')
+    (w, h) = lcd.image.size
+    for y in range(0, h, 3):
+        lcd.draw.line([(0, y), (w - 1, y)], fill=1)
+    lcd.draw.text((5, 2), 'header', fill=1)
+    lcd.display()
+
+    sent = 0
+    for n in range(5):
+        assert lcd.scroll(top, rows, 8)
+        lcd.draw.text((n * 10, top + rows - 8), 'line%d' % n, fill=1)
+
+        b = pi.bytes
+        assert lcd.display()
+        sent += pi.bytes - b
+
+        assert (panel(lcd.disp) == np.asarray(lcd.image)).all(), n
+
+    # less than repainting the band every time
+    assert sent < 5 * (rows // 8) * w
@@ -0,0 +1,120 @@
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+Oled.reopen() after bus errors, with a fake luma device
+
+$ python3 -m pytest tests
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+pytest.importorskip('RPi.GPIO')
+pytest.importorskip('luma.oled.device')
+
+import Oled as oled_mod             # noqa: E402
+from Oled import Oled, RetryPolicy  # noqa: E402
+
+
+class FakeDevice:
+    """
+    luma device: display() raises OSError while `fail` is set
+    """
+    def __init__(self, serial, rotate=0):
+        self.size = (128, 64)
+        (self.width, self.height) = self.size
+        self.fail = False
+        self.frames = 0
+
+    def display(self, img):
+        if self.fail:
+            raise OSError(121, 'Remote I/O error')
+        self.frames += 1
+
+    def command(self, *cmd):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class FakeSerial:
+    def cleanup(self):
+        pass
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    """
+    bus.ok = False: opening the interface fails
+    """
+    class Bus:
+        ok = True
+
+    def i2c(port=1, address=0x3C):
+        if not Bus.ok:
+            raise OSError(2, 'No such file or directory')
+        return FakeSerial()
+
+    monkeypatch.setattr(oled_mod, 'i2c', i2c)
+    monkeypatch.setattr(oled_mod, 'ssd1306', FakeDevice)
+    return Bus
+
+
+def new_oled(async_flush=False):
+    retry = RetryPolicy(max_retry=3, wait_sec=0, reopen_after=2)
+    return Oled('ssd1306', async_flush=async_flush, retry=retry,
+                image_cache=False)
+
+
+def test_reopen_failed(bus):
+    ol = new_oled()
+    old = ol.disp
+    old.fail = True
+    bus.ok = False
+
+    ol.draw.rectangle([(0, 0), (9, 9)], fill=1)
+    assert ol.display() is False
+
+    # the old device is kept: every try is a bus error, not an exception
+    assert ol.disp is old
+    assert ol.mode == '1'
+    assert ol.reopens == 2
+    assert ol.bus_errors == 4
+    assert ol.failed == 1
+    assert ol.resync
+
+
+def test_reopen_recovered(bus):
+    ol = new_oled()
+    old = ol.disp
+    old.fail = True
+
+    ol.draw.rectangle([(0, 0), (9, 9)], fill=1)
+    assert ol.display() is True
+
+    assert ol.disp is not old
+    assert ol.disp.frames == 1
+    assert ol.reopens == 1
+    assert ol.recoveries == 1
+    assert ol.failed == 0
+
+
+def test_reopen_failed_async(bus):
+    ol = new_oled(async_flush=True)
+    old = ol.disp
+    old.fail = True
+    bus.ok = False
+
+    ol.draw.rectangle([(0, 0), (9, 9)], fill=1)
+    assert ol.display() is True
+    ol.flusher.end()
+
+    # the flush thread gave the frame up and did not die on disp = None
+    assert ol.flusher.flushed == 1
+    assert ol.disp is old
+    assert ol.failed == 1
+    assert ol.resync
@@ -0,0 +1,110 @@
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+Scene over a StaticLayer: the native bytes of the layer reach the
+panel, with a fake luma ssd1327 (grey canvas, SSD1327Gray)
+
+$ python3 -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+pytest.importorskip('RPi.GPIO')
+pytest.importorskip('luma.oled.device')
+
+import Oled as oled_mod                         # noqa: E402
+from Oled import Oled, Scene, Sprite, StaticLayer  # noqa: E402
+
+
+class FakeSSD1327:
+    """
+    luma ssd1327: the controller RAM, 2 pixels per byte
+    """
+    def __init__(self, serial, rotate=0):
+        self.size = (128, 128)
+        (self.width, self.height) = self.size
+        self.ram = np.zeros((self.height, self.width // 2), dtype=np.uint8)
+        self.window = None
+        self.sent = []
+
+    def command(self, *cmd):
+        if len(cmd) == 6 and (cmd[0], cmd[3]) == (0x15, 0x75):
+            self.window = (cmd[1], cmd[4], cmd[2], cmd[5])
+
+    def data(self, data):
+        data = bytes(data)
+        self.sent.append(data)
+        (c0, r0, c1, r1) = self.window
+        self.ram[r0:r1 + 1, c0:c1 + 1] = np.frombuffer(
+            data, dtype=np.uint8).reshape(r1 - r0 + 1, c1 - c0 + 1)
+
+    def cleanup(self):
+        pass
+
+
+@pytest.fixture
+def ol(monkeypatch):
+    monkeypatch.setattr(oled_mod, 'i2c', lambda port, address: None)
+    monkeypatch.setattr(oled_mod, 'ssd1327', FakeSSD1327)
+    return Oled('ssd1327', image_cache=False)
+
+
+def shown(ol):
+    """
+    the panel shows ol.image
+    """
+    return ol.disp.ram.tobytes() == ol.disp.image_to_data(ol.image)
+
+
+def new_layer(ol, seed):
+    np.random.seed(seed)
+    pix = np.random.randint(0, 256, (128, 128), dtype=np.uint8)
+    return StaticLayer(ol, Image.fromarray(pix, 'L'))
+
+
+def test_layer_bytes_with_sprite(ol):
+    scene = Scene(ol)
+    sprite = scene.add(Sprite(Image.new('L', (8, 8), 255), (10, 20)))
+    layer = new_layer(ol, 1)
+    assert layer.data is not None
+
+    ol.show_layer(new_layer(ol, 3))
+    for n in range(5):
+        sprite.move_to(10 + n * 3, 20)
+        scene.compose()
+        assert ol.display()
+    # the layer and the box where the sprite is now, not where it was
+    assert ol.overlay == [(22, 20, 29, 27)]
+
+    ol.disp.sent.clear()
+    ol.show_layer(layer)
+    scene.compose()
+    assert ol.display()
+
+    assert ol.disp.sent[0] == layer.data
+    assert len(ol.disp.sent) == 2
+    assert shown(ol)
+
+
+def test_layer_bytes_bare(ol):
+    scene = Scene(ol)
+    sprite = scene.add(Sprite(Image.new('L', (8, 8), 255), (10, 20)))
+    scene.compose()
+    assert ol.display()
+
+    # nothing on the layer any more
+    sprite.show(False)
+    ol.show_layer(new_layer(ol, 2))
+    scene.compose()
+    assert ol.overlay == []
+
+    ol.disp.sent.clear()
+    assert ol.display()
+    assert ol.disp.sent == [ol.layer.data]
+    assert shown(ol)
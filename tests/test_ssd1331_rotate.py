@@ -0,0 +1,119 @@
+#
+# (c) 2020 Yoichi Tanibayashi
+#
+"""
+SSD1331 rotation on a simulated controller RAM
+
+$ python3 -m pytest tests
+"""
+import os
+import sys
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pigpio'))
+
+pytest.importorskip('pigpio')
+
+from FakePi import FakePi           # noqa: E402
+from SSD1331 import SSD1331         # noqa: E402
+
+COLS = 96
+ROWS = 64
+
+
+class SimRAM:
+    """
+    the address counter and the GDDRAM of SSD1331, and what the panel
+    shows. The panel is seen so that ROTATE[0] is upright.
+    """
+    def __init__(self):
+        self.remap = 0
+        self.ram = {}
+        self.cmd = []
+        self.window = None
+
+    def send(self, data, is_data=True, chunk_size=None):
+        if not is_data:
+            if isinstance(data, int):
+                data = [data]
+            self.command(list(data))
+            return
+
+        data = bytes(data)
+        (c0, c1, r0, r1) = self.window
+        addrs = [(c, r) for r in range(r0, r1 + 1)
+                 for c in range(c0, c1 + 1)]
+        if self.remap & 0x01:
+            # vertical address increment
+            addrs = [(c, r) for c in range(c0, c1 + 1)
+                     for r in range(r0, r1 + 1)]
+        for (i, addr) in enumerate(addrs):
+            self.ram[addr] = data[i * 2:i * 2 + 2]
+
+    def command(self, data):
+        if data[0] == 0xA0:
+            self.remap = data[1]
+        elif data[0] == 0x15:
+            self.col = (data[1], data[2])
+        elif data[0] == 0x75:
+            self.window = self.col + (data[1], data[2])
+
+    def view(self, addr):
+        """
+        (x, y) on the panel of the RAM address `addr`
+        """
+        (c, r) = addr
+        seg = COLS - 1 - c if self.remap & 0x02 else c
+        com = ROWS - 1 - r if self.remap & 0x10 else r
+        return (COLS - 1 - seg, ROWS - 1 - com)
+
+    def lit(self):
+        return sorted([self.view(a) for (a, v) in self.ram.items()
+                       if v != b'\0\0'])
+
+
+def rotate_cw(xy, size, rotate):
+    """
+    where (x, y) of an image of `size` lands when the image is turned
+    `rotate` x 90 degrees clockwise
+    """
+    (x, y) = xy
+    (w, h) = size
+    return {0: (x, y),
+            1: (h - 1 - y, x),
+            2: (w - 1 - x, h - 1 - y),
+            3: (y, w - 1 - x)}[rotate]
+
+
+@pytest.mark.parametrize('rotate', [0, 1, 2, 3])
+@pytest.mark.parametrize('corner', ['top_left', 'top_right', 'bottom_left'])
+def test_rotate_corner(rotate, corner):
+    disp = SSD1331(FakePi(call_sec=0, xfer_sec=0), rotate=rotate)
+    sim = SimRAM()
+    disp.send = sim.send
+    disp._init()
+
+    (w, h) = disp.size
+    xy = {'top_left': (0, 0),
+          'top_right': (w - 1, 0),
+          'bottom_left': (0, h - 1)}[corner]
+    image = Image.new('RGB', disp.size)
+    image.putpixel(xy, (255, 255, 255))
+    disp.display(image)
+
+    assert sim.lit() == [rotate_cw(xy, disp.size, rotate)]
+
+
+@pytest.mark.parametrize('rotate', [1, 3])
+def test_rotate_window(rotate):
+    disp = SSD1331(FakePi(call_sec=0, xfer_sec=0), rotate=rotate)
+    sim = SimRAM()
+    disp.send = sim.send
+    disp._init()
+
+    image = Image.new('RGB', disp.size)
+    image.putpixel((10, 20), (255, 255, 255))
+    disp.display(image, 8, 16, 15, 31)
+
+    assert sim.lit() == [rotate_cw((10, 20), disp.size, rotate)]